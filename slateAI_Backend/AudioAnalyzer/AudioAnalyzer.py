@@ -5,14 +5,18 @@
 from keras.models import model_from_json
 import librosa
 import numpy as np
+import scipy.fftpack
+import scipy.signal
 import os
 import fleep
 import time
+import threading
 from CryptoManager import CryptoManager
 from PathManager import PathManager
 from PlaidMLManager import PlaidMLManager
 from LogManager import LogManager
-from typing import List, Tuple, Union
+from AudioAnalyzer.AudioStream import AudioStream
+from typing import Iterator, List, Tuple, Union
 
 
 class AudioAnalyzer:
@@ -22,18 +26,41 @@ class AudioAnalyzer:
         logger: The logger to use for logging analyzed files.
         plaidml_manager: The PlaidMLManager object needed for accurate logging.
         model: The model used for infering one-second-chunks of audio data.
+        path_weights: Path of the weights file of the model.
+        model_lock: Serializes inference, because several files can be analyzed in parallel threads.
+        feature_batch_size: Amount of audio snippets whose MFCC features are computed together.
+        mel_bases: Mel filter banks per sample rate, created on first use: {sr: np.ndarray, ...}.
+        max_feature_sr: Snippets of files with a higher sample rate are resampled to it before their features are
+            extracted, one second at 48 kHz fills the 94 feature columns of the model.
+        candidate_count: Amount of seconds shortlisted for inference by their transient score.
+            None scores every second of the file.
+        fallback_confidence: If no shortlisted second reaches this confidence, every second is scored.
+        prior_seconds: Length of the head and tail of a file whose seconds are scored before all others.
+            None gives every second the same priority.
     """
 
-    def __init__(self, logger: LogManager, plaidml_manager: PlaidMLManager):
+    def __init__(self, logger: LogManager, plaidml_manager: PlaidMLManager,
+                 candidate_count: int = 64, fallback_confidence: float = 0.5, prior_seconds: float = None):
         """Initializes the AudioAnalyzer and loads and decrypts the inference model.
 
         Args:
             logger: The logger to use for logging analyzed files.
             plaidml_manager: The PlaidMLManager object needed for accurate logging.
+            candidate_count: Optional; Amount of seconds shortlisted for inference. None scores every second.
+            fallback_confidence: Optional; Minimal confidence of the shortlist, below it every second is scored.
+            prior_seconds: Optional; Claps are almost always in the first or last seconds of a take.
+                If given, the seconds within the first and last prior_seconds are scored first.
         """
 
         self.logger = logger
         self.plaidml_manager = plaidml_manager
+        self.candidate_count = candidate_count
+        self.fallback_confidence = fallback_confidence
+        self.prior_seconds = prior_seconds
+        self.model_lock = threading.Lock()
+        self.feature_batch_size = 64
+        self.mel_bases = dict()
+        self.max_feature_sr = 48000
 
         key = b'\xaa\xc0\x82)\x12nc\x92\x03)j\xdf\xc1\xc4\x94\x9d(\x9e[EX\xe8\x15\x23I{\xa2$\x05(\xd2\x11'
         crypto = CryptoManager(key=key)
@@ -41,6 +68,7 @@ class AudioAnalyzer:
         path_manager = PathManager()
         path_json = os.path.join(path_manager.get_app_path(), 'AudioAnalyzer/model/model.json.enc')
         path_weights = os.path.join(path_manager.get_app_path(), 'AudioAnalyzer/model/model.h5')
+        self.path_weights = path_weights
 
         with open(path_json, 'rb') as json_file:
             crypto_json = json_file.read()
@@ -76,10 +104,14 @@ class AudioAnalyzer:
     def analyze(self, path: str) -> List[float]:
         """Analyzes one single file given its path.
 
-        The file is imported as a one-dimensional (mono) array of values/samples.
-        The array is segmented into one-second-chunks, sorted by the highest/loudest value within each second.
+        The file is opened as a stream of one-dimensional (mono) values/samples and read block by block once.
+        The stream is segmented into one-second-chunks, sorted by the highest/loudest value within each second.
+        Afterwards only the audio snippets around the scored seconds are read again.
+        The seconds are scored in stages (see candidate_stages): the head and tail of the file and the
+        candidate_count seconds with the highest transient score (see shortlist_seconds) come first.
         From every chunk the MFCC features are extracted and stacked for inference.
-        The inference reveals the second containing the clap sound.
+        The inference reveals the second containing the clap sound. If none of the seconds of a stage reaches
+        the fallback_confidence, the next stage is scored, the last one being all seconds.
         The spectral features are used again to determine the exact timestamp of the clap
         (a clap sound is loud and has a pretty even spectral distribution).
 
@@ -92,32 +124,163 @@ class AudioAnalyzer:
 
         start_time = time.time()
 
-        channels, sr = self.load(path)
-        seconds = self.sort_seconds(channels, sr)
-        maxima = self.get_maxima(channels, sr, seconds, len(seconds))  # currently all secs are used for better results.
-        mfcc_stacked = self.stack_features(maxima, sr)
-        prediction = self.predict(mfcc_stacked)
+        audio, sr = self.load(path)
+        try:
+            starts, positions, values, rms = self.second_statistics(audio, sr)
+            seconds = self.rank_seconds(starts, positions, values)
+
+            for candidates in self.candidate_stages(rms, sr, seconds, len(audio)):
+                maxima, prediction = self.score_seconds(audio, sr, candidates)
+
+                if max(prediction) >= self.fallback_confidence:
+                    break
+                print("No clap among the {} candidates.".format(len(candidates)))
+        finally:
+            audio.close()
 
         index_of_second_with_clap = prediction.index(max(prediction))
-        start_sample_of_second_with_clap = seconds[index_of_second_with_clap][-1]
+        start_sample_of_second_with_clap = candidates[index_of_second_with_clap][-1]
         snippet_of_second_with_clap = maxima[index_of_second_with_clap]
         klapp_sample = start_sample_of_second_with_clap + self.find_clap_in_second(snippet_of_second_with_clap)
         syncpoint = [klapp_sample / sr]
 
-        self.log(path, syncpoint, sr, librosa.get_duration(channels, sr), time.time()-start_time)
+        self.log(path, syncpoint, sr, len(audio) / sr, time.time()-start_time)
         return syncpoint
 
-    def load(self, path: str) -> Tuple[np.ndarray, int]:
-        """Loads a file from its path using the librosa package.
+    def candidate_stages(self, rms: np.ndarray, sr: int, seconds: List[List[Union[int, float]]],
+                         length: int) -> Iterator[List[List[Union[int, float]]]]:
+        """Yields the selections of seconds to score one after the other, from the most likely to all of them.
+
+        1. With prior_seconds: the seconds within the head and tail of the file (shortlisted to candidate_count).
+        2. With candidate_count: the shortlist of all seconds.
+        3. All seconds.
+
+        Args:
+            rms: The RMS level of each second (coming from second_rms or second_statistics).
+            sr: The sample rate of the audio data.
+            seconds: A list of lists characterizing seconds (has to come from sort_seconds function).
+            length: The amount of samples of the audio data.
+
+        Yields:
+            Copies of entries of seconds, to be passed to score_seconds.
+        """
+
+        shortlist = self.candidate_count is not None and self.candidate_count < len(seconds)
+
+        if self.prior_seconds:
+            border = int(self.prior_seconds * sr)
+            prior = [second for second in seconds if second[0] < border or second[0] >= length - border]
+            if len(prior) < len(seconds):
+                yield self.shortlist_seconds(rms, sr, prior, self.candidate_count if shortlist else len(prior))
+
+        if shortlist:
+            yield self.shortlist_seconds(rms, sr, seconds, self.candidate_count)
+
+        yield [list(second) for second in seconds]
+
+    def score_seconds(self, channels: Union[np.ndarray, AudioStream], sr: int,
+                      seconds: List[List[Union[int, float]]]) -> Tuple[List[np.ndarray], List[float]]:
+        """Centers the seconds around their peaks, extracts their features and infers them.
+
+        Args:
+            channels: The audio data (an array or an AudioStream).
+            sr: The sample rate of the audio data.
+            seconds: The seconds to score (coming from sort_seconds or shortlist_seconds). Gets modified.
+
+        Returns:
+            The audio snippets (see get_maxima) and the clap confidence for each of them.
+        """
+
+        maxima = self.get_maxima(channels, sr, seconds, len(seconds))
+        mfcc_stacked = self.stack_features(maxima, sr)
+        return maxima, self.predict(mfcc_stacked)
+
+    def shortlist_seconds(self, rms: np.ndarray, sr: int, seconds: List[List[Union[int, float]]],
+                          amount: int) -> List[List[Union[int, float]]]:
+        """Selects the seconds most likely to contain a clap by a cheap transient score.
+
+        A clap is a loud and short impulse, so its second has a high peak compared to its RMS level.
+        The score peak * (peak / rms) favors seconds that are loud and impulsive at the same time,
+        so quiet clicks and loud steady noise both rank low.
+
+        Args:
+            rms: The RMS level of each second (coming from second_rms or second_statistics).
+            sr: The sample rate of the audio data.
+            seconds: A list of lists characterizing seconds (has to come from sort_seconds function).
+            amount: The amount of seconds to select.
+
+        Returns:
+            Copies of the selected entries of seconds, sorted by descending score.
+        """
+
+        starts = np.array([second[0] for second in seconds], dtype=np.int64)
+        peaks = np.array([second[2] for second in seconds], dtype=np.float64)
+        scores = peaks * peaks / (rms[starts // sr] + 1e-9)
+
+        order = np.argsort(-scores, kind='stable')[:amount]
+        return [list(seconds[i]) for i in order]
+
+    def second_rms(self, channels: np.ndarray, sr: int) -> np.ndarray:
+        """Computes the RMS level of each one-second chunk of the audio.
+
+        Args:
+            channels: The audio data.
+            sr: The sample rate of the audio data.
+
+        Returns:
+            An array with the RMS level of each second (the last one can be a partial second).
+        """
+
+        full_seconds = len(channels) // sr
+        rows = channels[:full_seconds * sr].reshape(full_seconds, sr)
+        rms = np.sqrt(np.einsum('ij,ij->i', rows, rows, dtype=np.float64) / sr)
+
+        if len(channels) > full_seconds * sr:  # partial second at the end of the file
+            rest = channels[full_seconds * sr:].astype(np.float64)
+            rms = np.append(rms, np.sqrt(np.mean(rest * rest)))
+
+        return rms
+
+    def second_statistics(self, audio: AudioStream,
+                          sr: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Computes the peak and the RMS level of every second in one pass over the blocks of an AudioStream.
+
+        The blocks are multiples of a second long, so the results are the same as for the whole file in memory.
+        For memory mapped WAV files the search runs on the integer channel sums, no block is converted to float.
+
+        Args:
+            audio: The audio stream.
+            sr: The sample rate of the audio data.
+
+        Returns:
+            The arrays of second_peaks (starts, positions, values) and of second_rms.
+        """
+
+        starts, positions, values, rms = list(), list(), list(), list()
+        for block_start, block in audio.blocks():
+            block_starts, block_positions, block_values = self.second_peaks(block, sr)
+            starts.append(block_starts + block_start)
+            positions.append(block_positions)
+            values.append(block_values)
+            rms.append(self.second_rms(block, sr))
+
+        # memory mapped WAV files yield raw channel sums, only the peaks and levels are scaled to float
+        values = (np.concatenate(values) * audio.scale).astype(np.float32)
+        rms = np.concatenate(rms) * audio.scale
+        return np.concatenate(starts), np.concatenate(positions), values, rms
+
+    def load(self, path: str) -> Tuple[AudioStream, int]:
+        """Opens a file from its path as AudioStream, without decoding it completely.
 
         Args:
             path: The path of the file that needs to be loaded.
 
         Returns:
-            An array containing all the samples, as well as the sample rate of the file.
+            An AudioStream for the samples, as well as the sample rate of the file.
         """
 
-        return librosa.load(path, mono=True, sr=None)
+        audio = AudioStream(path)
+        return audio, audio.sr
 
     def sort_seconds(self, channels: np.ndarray, sr: int) -> List[List[Union[int, float]]]:
         """Segments the audio into one-second chunks sorted by the loudest peak within them.
@@ -135,22 +298,66 @@ class AudioAnalyzer:
             It is sorted by value.
         """
 
-        seconds = []
-        for start in range(len(channels))[::sr]:
-            end = min(start + sr - 1, len(channels))
-            ch = channels[start:end]
-            value = max(ch)
-            pos = np.where(ch == value)[0][0]
-            seconds.append([start, pos, value])
-        seconds = sorted(seconds, reverse=True, key=lambda x: x[-1])
+        return self.rank_seconds(*self.second_peaks(channels, sr))
+
+    def rank_seconds(self, starts: np.ndarray, positions: np.ndarray,
+                     values: np.ndarray) -> List[List[Union[int, float]]]:
+        """Builds the list of seconds sorted by their loudest peak (see sort_seconds) from second_peaks arrays.
+
+        Args:
+            starts: The index of the starting sample of each second.
+            positions: The index of the loudest sample within each second.
+            values: The loudest value of each second.
+
+        Returns:
+            A list of [start, pos, value] lists, sorted by value.
+        """
+
+        order = np.argsort(-values, kind='stable')  # stable like sorted(), equal values keep their order
+        seconds = [[start, pos, value] for start, pos, value in zip(starts[order].tolist(),
+                                                                     positions[order],
+                                                                     values[order])]
         return seconds
 
-    def get_maxima(self, channels: np.ndarray, sr: int,
+    def second_peaks(self, channels: np.ndarray, sr: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Finds the loudest sample within each one-second chunk of the audio.
+
+        The full seconds are reshaped into a two-dimensional view (one row per second), so the peaks of all
+        of them are found by a single argmax without copying any samples. A trailing partial second is
+        handled separately. Like before, the last sample of each full second is not taken into account.
+
+        Args:
+            channels: The audio data that needs to be split.
+            sr: The sample rate of the audio data.
+
+        Returns:
+            Three arrays with one entry per second: the index of its starting sample,
+            the index of its loudest sample (counting from start) and the loudest value.
+        """
+
+        full_seconds = len(channels) // sr
+        rows = channels[:full_seconds * sr].reshape(full_seconds, sr)[:, :sr - 1]
+        positions = np.argmax(rows, axis=1)
+        values = rows[np.arange(full_seconds), positions]
+
+        if len(channels) > full_seconds * sr:  # partial second at the end of the file
+            rest = channels[full_seconds * sr:]
+            rest_position = np.argmax(rest)
+            positions = np.append(positions, rest_position)
+            values = np.append(values, rest[rest_position])
+
+        starts = np.arange(len(positions), dtype=np.int64) * sr
+        return starts, positions, values
+
+    def get_maxima(self, channels: Union[np.ndarray, AudioStream], sr: int,
                    seconds: List[List[Union[int, float]]], amount: int) -> List[np.ndarray]:
         """Centers the loudest seconds around the loudest samples within them.
 
+        The window borders of all seconds are computed at once. For an array the returned windows are views
+        into channels, for an AudioStream only these windows are read from the file.
+
         Args:
-            channels: The audio data that needs to be split.
+            channels: The audio data that needs to be split (an array or an AudioStream).
             sr: The sample rate of the audio data.
             seconds: A list of lists characterizing seconds (has to come from sort_seconds function).
                 Gets modified during this process.
@@ -161,15 +368,14 @@ class AudioAnalyzer:
             A list of the audio arrays of maxima, centered around the loudest peak.
         """
 
+        count = min(amount, len(seconds))
+        middles = np.array([start + pos for start, pos, _ in seconds[:count]], dtype=np.int64)
+        starts = middles - int(sr / 2)
+        ends = middles + int(sr / 2) + np.maximum(-starts, 0)  # windows at the beginning are moved to the right
+        starts = np.maximum(starts, 0)
+
         maxima = []
-        for i in range(min(amount, len(seconds))):
-            start, pos, value = seconds[i]
-            middle = start + pos
-            start = middle - int(sr / 2)
-            end = middle + int(sr / 2)
-            if start < 0:
-                end += abs(start)
-                start = 0
+        for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
             seconds[i].append(start)
             maxima.append(channels[start:end])
         return maxima
@@ -192,9 +398,55 @@ class AudioAnalyzer:
             mfcc = np.pad(mfcc, ((0, 0), ((0, missing_cols))), "edge")
         return mfcc
 
+    def get_mfcc_batch(self, snippets: np.ndarray, sr: int, n_mfcc: int = 40,
+                       n_fft: int = 2048, hop_length: int = 512) -> np.ndarray:
+        """Extracts the MFCC feature matrices of several audio snippets of the same length at once.
+
+        Follows the steps of librosa.feature.mfcc with its default parameters (centered, reflect padded
+        STFT with a Hann window, power mel spectrogram with 128 bands, power_to_db with top_db=80 per snippet
+        and an orthonormal DCT-II), but runs every step on all snippets in one NumPy operation.
+
+        Args:
+            snippets: A two-dimensional array of audio snippets (one per row).
+            sr: The sample rate of the audio data.
+            n_mfcc: Number of MFCC feature sets (rows).
+            n_fft: Length of the FFT window.
+            hop_length: Number of samples between two STFT columns.
+
+        Returns:
+            An array of feature matrices (snippets x n_mfcc x columns).
+        """
+
+        if sr not in self.mel_bases:
+            self.mel_bases[sr] = librosa.filters.mel(sr=sr, n_fft=n_fft).astype(np.float32)
+        fft_window = scipy.signal.get_window('hann', n_fft, fftbins=True).astype(np.float32)
+
+        padded = np.pad(snippets, ((0, 0), (n_fft // 2, n_fft // 2)), mode='reflect')
+        n_frames = 1 + (padded.shape[1] - n_fft) // hop_length
+        frames = np.lib.stride_tricks.as_strided(padded,
+                                                 shape=(padded.shape[0], n_frames, n_fft),
+                                                 strides=(padded.strides[0],
+                                                          padded.strides[1] * hop_length,
+                                                          padded.strides[1]),
+                                                 writeable=False)
+
+        spectrum = np.abs(np.fft.rfft(frames * fft_window, axis=-1).astype(np.complex64)) ** 2
+        mel = np.matmul(spectrum, self.mel_bases[sr].T)  # snippets x frames x mel bands
+
+        log_mel = 10.0 * np.log10(np.maximum(1e-10, mel))
+        log_mel = np.maximum(log_mel, log_mel.max(axis=(1, 2), keepdims=True) - 80.0)
+
+        mfcc = scipy.fftpack.dct(log_mel, axis=-1, type=2, norm='ortho')[..., :n_mfcc]
+        return np.swapaxes(mfcc, 1, 2)
+
     def stack_features(self, maxima: List[np.ndarray], sr: int) -> np.ndarray:
         """The features of multiple audio snippets are stacked on top of each other for faster inference.
 
+        Snippets of the same length (usually all of them) are processed in batches of feature_batch_size
+        by get_mfcc_batch and written straight into a preallocated array. Like in get_mfcc, the features are
+        padded to 94 columns. Snippets of sample rates above max_feature_sr are resampled to it first, so the
+        peak in the middle of each snippet stays in the middle of its features.
+
         Args:
             maxima: The list of audio snippets to extract the features from.
             sr: The sample rate of the audio data.
@@ -203,11 +455,31 @@ class AudioAnalyzer:
             A stacked feature set, ready for inference.
         """
 
-        mfcc_stacked = np.expand_dims(np.expand_dims(self.get_mfcc(maxima[0], sr), axis=2), axis=0)
-        if len(maxima) > 1:
-            for m in maxima[1::]:
-                mfcc = np.expand_dims(np.expand_dims(self.get_mfcc(m, sr), axis=2), axis=0)
-                mfcc_stacked = np.append(mfcc_stacked, mfcc, axis=0)
+        n_mfcc, n_columns = 40, 94
+        mfcc_stacked = np.empty((len(maxima), n_mfcc, n_columns, 1), dtype=np.float32)
+
+        feature_sr = min(sr, self.max_feature_sr)
+        divisor = np.gcd(sr, feature_sr)
+
+        indices_by_length = dict()
+        for i, snippet in enumerate(maxima):
+            indices_by_length.setdefault(len(snippet), list()).append(i)
+
+        for indices in indices_by_length.values():
+            for batch_start in range(0, len(indices), self.feature_batch_size):
+                batch_indices = indices[batch_start:batch_start + self.feature_batch_size]
+                snippets = np.stack([maxima[i] for i in batch_indices])
+                if feature_sr != sr:
+                    snippets = scipy.signal.resample_poly(snippets, feature_sr // divisor, sr // divisor,
+                                                          axis=1).astype(np.float32)
+                mfcc = self.get_mfcc_batch(snippets, feature_sr, n_mfcc=n_mfcc)
+                if mfcc.shape[2] > n_columns:  # keep the columns around the centered peak
+                    start = (mfcc.shape[2] - n_columns) // 2
+                    mfcc = mfcc[:, :, start:start + n_columns]
+                if mfcc.shape[2] < n_columns:
+                    mfcc = np.pad(mfcc, ((0, 0), (0, 0), (0, n_columns - mfcc.shape[2])), "edge")
+                mfcc_stacked[batch_indices, :, :, 0] = mfcc
+
         return mfcc_stacked
 
     def predict(self, data: np.ndarray) -> List[float]:
@@ -220,7 +492,8 @@ class AudioAnalyzer:
             A list of confidences for each feature set.
         """
 
-        prediction = self.model.predict(data)
+        with self.model_lock:
+            prediction = self.model.predict(data)
         prediction = [klapp if klapp < 1 else klapp - noklapp for klapp, noklapp in prediction.astype(float)]
         return prediction
 
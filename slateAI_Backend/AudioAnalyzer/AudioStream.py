@@ -0,0 +1,238 @@
+"""A class that gives block-wise and random access to the samples of an audio file.
+"""
+
+import librosa
+import numpy as np
+import soundfile
+import struct
+from typing import Iterator, Optional, Tuple
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class AudioStream:
+    """Reads the mono downmix of an audio file in blocks, so the whole file never has to be in memory.
+
+    Uncompressed PCM or float WAV, BWF and RF64 files are memory mapped: the data chunk is used in place and
+    the mono downmix is the integer sum of the channels, so no sample is decoded or converted to float
+    until a window is read.
+    Other files supported by libsndfile (AIFF, FLAC, OGG, ...) are streamed from disk.
+    Any other file (e.g. compressed audio inside a video container) is decoded completely by librosa.
+    Every way the stream behaves like a one-dimensional float32 array of mono samples:
+    len(stream) is the amount of samples and stream[start:end] returns the samples in that range.
+
+    Attributes:
+        path: Path of the audio file.
+        memmap: The memory mapped data chunk of a WAV file (samples x channels, or samples x channels x 3 bytes
+            for 24 bit) or None.
+        bits: Bits per sample of the memory mapped file.
+        sound_file: The open soundfile.SoundFile object or None if the file is memory mapped or decoded completely.
+        data: The decoded samples if the file is not supported by libsndfile, otherwise None.
+        sr: The sample rate of the file.
+        frames: The amount of samples (per channel) in the file.
+        scale: The factor converting the blocks yielded by blocks() into float samples.
+            For memory mapped files the blocks are the raw channel sums, otherwise it is 1.
+        block_frames: The amount of samples per block yielded by blocks(). Always a multiple of sr.
+    """
+
+    def __init__(self, path: str, block_seconds: int = 10):
+        """Opens the audio file.
+
+        Args:
+            path: Path of the audio file.
+            block_seconds: Optional; Length of the blocks yielded by blocks() in seconds.
+        """
+
+        self.path = path
+        self.memmap = None
+        self.bits = None
+        self.sound_file = None
+        self.data = None
+        self.scale = 1.0
+
+        wav_format = self.parse_wav(path)
+        if wav_format is not None:
+            format_tag, channels, self.sr, bits, offset, size = wav_format
+            self.open_memmap(format_tag, channels, bits, offset, size)
+            self.frames = len(self.memmap)
+        else:
+            try:
+                self.sound_file = soundfile.SoundFile(path)
+                self.sr = self.sound_file.samplerate
+                self.frames = self.sound_file.frames
+            except RuntimeError:  # format not supported by libsndfile
+                self.data, self.sr = librosa.load(path, mono=True, sr=None)
+                self.frames = len(self.data)
+
+        self.block_frames = block_seconds * self.sr
+
+    def __len__(self) -> int:
+        return self.frames
+
+    def __getitem__(self, item: slice) -> np.ndarray:
+        """Returns the mono samples of a range like slicing an array does: stream[start:end]."""
+
+        if self.data is not None:
+            return self.data[item]
+
+        start, stop, _ = item.indices(self.frames)
+        return self.read(start, max(start, stop))
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        """Reads and downmixes the samples from start to stop.
+
+        Args:
+            start: Index of the first sample.
+            stop: Index after the last sample.
+
+        Returns:
+            The mono samples as float32 array.
+        """
+
+        if self.data is not None:
+            return self.data[start:stop]
+
+        if self.memmap is not None:
+            return (self.channel_sum(self.memmap[start:stop]) * self.scale).astype(np.float32)
+
+        self.sound_file.seek(start)
+        return self.to_mono(self.sound_file.read(stop - start, dtype='float32', always_2d=True))
+
+    def blocks(self) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yields the whole file as consecutive blocks of block_frames mono samples (the last one can be shorter).
+
+        For memory mapped files the blocks are the channel sums in the integer (or float) type of the file.
+        They have to be multiplied by scale to get float samples, which is only needed for a few values.
+
+        Yields:
+            Tuples of (index of the first sample of the block, mono samples of the block).
+        """
+
+        if self.data is not None:
+            for start in range(0, self.frames, self.block_frames):
+                yield start, self.data[start:start + self.block_frames]
+            return
+
+        if self.memmap is not None:
+            for start in range(0, self.frames, self.block_frames):
+                yield start, self.channel_sum(self.memmap[start:start + self.block_frames])
+            return
+
+        self.sound_file.seek(0)
+        start = 0
+        for block in self.sound_file.blocks(blocksize=self.block_frames, dtype='float32', always_2d=True):
+            yield start, self.to_mono(block)
+            start += len(block)
+
+    @staticmethod
+    def parse_wav(path: str) -> Optional[Tuple[int, int, int, int, int, int]]:
+        """Reads the chunk headers of a RIFF/RF64 WAVE file (BWF included) to find its sample format and data.
+
+        Args:
+            path: Path of the audio file.
+
+        Returns:
+            A tuple of (format tag, channels, sample rate, bits per sample, offset of the data, size of the data)
+            or None if the file is no uncompressed WAVE file that can be memory mapped.
+        """
+
+        with open(path, 'rb') as file:
+            header = file.read(12)
+            if len(header) < 12 or header[:4] not in (b'RIFF', b'RF64') or header[8:12] != b'WAVE':
+                return None
+
+            file_size = file.seek(0, 2)
+            position = 12
+            data_size_64 = None
+            fmt = None
+            while position + 8 <= file_size:
+                file.seek(position)
+                chunk_id, chunk_size = struct.unpack('<4sI', file.read(8))
+
+                if chunk_id == b'ds64':  # RF64: the real sizes do not fit into the 32 bit chunk sizes
+                    data_size_64 = struct.unpack('<QQ', file.read(16))[1]
+                elif chunk_id == b'fmt ':
+                    fmt = file.read(chunk_size)
+                elif chunk_id == b'data':
+                    if fmt is None or len(fmt) < 16:
+                        return None
+                    if chunk_size == 0xFFFFFFFF and data_size_64 is not None:
+                        chunk_size = data_size_64
+                    format_tag, channels, sr, _, block_align, bits = struct.unpack('<HHIIHH', fmt[:16])
+                    if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                        format_tag = struct.unpack('<H', fmt[24:26])[0]  # first two bytes of the sub format GUID
+
+                    supported = (format_tag == WAVE_FORMAT_PCM and bits in (8, 16, 24, 32)) or \
+                                (format_tag == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64))
+                    if not supported or channels == 0 or block_align != channels * bits // 8:
+                        return None
+                    position += 8
+                    return format_tag, channels, sr, bits, position, min(chunk_size, file_size - position)
+
+                position += 8 + chunk_size + (chunk_size & 1)  # chunks are padded to an even size
+
+        return None
+
+    def open_memmap(self, format_tag: int, channels: int, bits: int, offset: int, size: int):
+        """Memory maps the data chunk of a WAVE file and sets the scale of its channel sums.
+
+        Args:
+            format_tag: WAVE_FORMAT_PCM or WAVE_FORMAT_IEEE_FLOAT.
+            channels: The amount of channels.
+            bits: Bits per sample.
+            offset: Offset of the data chunk in the file.
+            size: Size of the data chunk in bytes.
+        """
+
+        frames = size // (channels * bits // 8)
+        if format_tag == WAVE_FORMAT_IEEE_FLOAT:
+            dtype = np.float32 if bits == 32 else np.float64
+            self.scale = 1.0 / channels
+        else:
+            dtype = {8: np.uint8, 16: np.int16, 24: np.uint8, 32: np.int32}[bits]
+            self.scale = 1.0 / (channels * 2 ** (bits - 1))
+
+        shape = (frames, channels, 3) if bits == 24 else (frames, channels)
+        if frames:
+            self.memmap = np.memmap(self.path, dtype=dtype, mode='r', offset=offset, shape=shape)
+        else:  # numpy cannot map zero bytes
+            self.memmap = np.zeros(shape, dtype=dtype)
+        self.bits = bits
+
+    def channel_sum(self, samples: np.ndarray) -> np.ndarray:
+        """Sums up the channels of a range of the memory mapped data without converting it to float.
+
+        Args:
+            samples: A slice of memmap.
+
+        Returns:
+            The sums as one-dimensional array (int64 for integer formats). A single channel of a 16 or 32 bit
+            file is returned as view into the file.
+        """
+
+        if self.bits == 24:  # three little-endian bytes, sign extended by the most significant one
+            samples = samples[..., 0].astype(np.int32) | (samples[..., 1].astype(np.int32) << 8) | \
+                      (samples[..., 2].astype(np.int8).astype(np.int32) << 16)
+        elif self.bits == 8:  # unsigned with an offset of 128
+            samples = samples.astype(np.int16) - 128
+
+        if samples.shape[1] == 1:
+            return samples[:, 0]
+        return np.sum(samples, axis=1, dtype=np.float64 if samples.dtype.kind == 'f' else np.int64)
+
+    @staticmethod
+    def to_mono(block: np.ndarray) -> np.ndarray:
+        """Downmixes a (samples x channels) block by averaging the channels, like librosa.to_mono."""
+
+        if block.shape[1] == 1:
+            return block[:, 0]
+        return np.mean(block, axis=1, dtype=np.float32)
+
+    def close(self):
+        """Closes the file."""
+
+        if self.sound_file is not None:
+            self.sound_file.close()
+        self.memmap = None  # the mapping is closed as soon as no view into it is left
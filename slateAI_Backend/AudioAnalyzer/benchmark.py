@@ -0,0 +1,130 @@
+"""Benchmarks the AudioAnalyzer preprocessing against its former loop-based implementation.
+
+Usage (from the slateAI_Backend directory):
+    python -m AudioAnalyzer.benchmark --hours 2 --sr 96000
+    python -m AudioAnalyzer.benchmark --wav /path/to/long_recording.wav
+
+With --wav the streamed block-wise pass of AudioStream is compared to the file loaded at once as well.
+
+Both implementations run on the same audio data and their outputs are compared for equality
+(MFCC features up to float rounding).
+"""
+
+import argparse
+import time
+import numpy as np
+import librosa
+from AudioAnalyzer.AudioAnalyzer import AudioAnalyzer
+from AudioAnalyzer.AudioStream import AudioStream
+from typing import Callable, Tuple, Any
+
+
+def sort_seconds_loop(channels: np.ndarray, sr: int):
+    """The former implementation of AudioAnalyzer.sort_seconds (one Python iteration per second)."""
+
+    seconds = []
+    for start in range(len(channels))[::sr]:
+        end = min(start + sr - 1, len(channels))
+        ch = channels[start:end]
+        value = max(ch)
+        pos = np.where(ch == value)[0][0]
+        seconds.append([start, pos, value])
+    seconds = sorted(seconds, reverse=True, key=lambda x: x[-1])
+    return seconds
+
+
+def get_maxima_loop(channels: np.ndarray, sr: int, seconds, amount: int):
+    """The former implementation of AudioAnalyzer.get_maxima (one Python iteration per second)."""
+
+    maxima = []
+    for i in range(min(amount, len(seconds))):
+        start, pos, value = seconds[i]
+        middle = start + pos
+        start = middle - int(sr / 2)
+        end = middle + int(sr / 2)
+        if start < 0:
+            end += abs(start)
+            start = 0
+        seconds[i].append(start)
+        maxima.append(channels[start:end])
+    return maxima
+
+
+def stack_features_loop(audio_analyzer: AudioAnalyzer, maxima, sr: int):
+    """The former implementation of AudioAnalyzer.stack_features (one librosa call and one copy per snippet)."""
+
+    mfcc_stacked = np.expand_dims(np.expand_dims(audio_analyzer.get_mfcc(maxima[0], sr), axis=2), axis=0)
+    if len(maxima) > 1:
+        for m in maxima[1::]:
+            mfcc = np.expand_dims(np.expand_dims(audio_analyzer.get_mfcc(m, sr), axis=2), axis=0)
+            mfcc_stacked = np.append(mfcc_stacked, mfcc, axis=0)
+    return mfcc_stacked
+
+
+def timed(function: Callable, *args) -> Tuple[Any, float]:
+    """Runs the function with args and returns its result and its duration in seconds."""
+
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--wav', help='Audio file to use instead of synthetic noise.')
+    parser.add_argument('--hours', type=float, default=2, help='Duration of the synthetic audio in hours.')
+    parser.add_argument('--sr', type=int, default=96000, help='Sample rate of the synthetic audio.')
+    parser.add_argument('--snippets', type=int, default=1000,
+                        help='Amount of snippets for the stack_features benchmark (48 kHz, see get_mfcc).')
+    args = parser.parse_args()
+
+    if args.wav:
+        channels, sr = librosa.load(args.wav, mono=True, sr=None)
+    else:
+        sr = args.sr
+        channels = (np.random.RandomState(0).randn(int(args.hours * 3600 * sr)) * 0.1).astype(np.float32)
+    print("{:.2f} hours of audio at {} Hz".format(len(channels) / sr / 3600, sr))
+
+    # The analyzer model is not needed for preprocessing, so __init__ is skipped.
+    audio_analyzer = AudioAnalyzer.__new__(AudioAnalyzer)
+    audio_analyzer.feature_batch_size = 64
+    audio_analyzer.mel_bases = dict()
+
+    seconds_loop, duration_loop = timed(sort_seconds_loop, channels, sr)
+    seconds, duration = timed(audio_analyzer.sort_seconds, channels, sr)
+    assert seconds == seconds_loop, "sort_seconds output differs"
+    print("sort_seconds: loop {:.2f}s, vectorized {:.2f}s ({:.1f}x)".format(
+        duration_loop, duration, duration_loop / duration))
+
+    if args.wav:
+        audio = AudioStream(args.wav)
+        (starts, positions, values, rms), duration = timed(audio_analyzer.second_statistics, audio, sr)
+        audio.close()
+        streamed = audio_analyzer.rank_seconds(starts, positions, values)
+        # memory mapped WAV files are scaled from integer sums, so values may differ in the last float bit
+        assert np.allclose([s[2] for s in streamed], [s[2] for s in seconds_loop], atol=1e-6), \
+            "streamed seconds differ"
+        assert np.allclose(rms, audio_analyzer.second_rms(channels, sr)), "streamed rms differs"
+        print("second_statistics ({}): {:.2f}s".format(
+            "memory mapped" if audio.bits else "streamed from disk", duration))
+
+    maxima_loop, duration_loop = timed(get_maxima_loop, channels, sr, seconds_loop, len(seconds_loop))
+    maxima, duration = timed(audio_analyzer.get_maxima, channels, sr, seconds, len(seconds))
+    assert seconds == seconds_loop, "get_maxima window starts differ"
+    assert all(np.array_equal(a, b) for a, b in zip(maxima, maxima_loop)), "get_maxima output differs"
+    print("get_maxima: loop {:.2f}s, vectorized {:.2f}s ({:.1f}x)".format(
+        duration_loop, duration, duration_loop / duration))
+
+    # The feature extraction expects one-second snippets at 48 kHz (94 MFCC columns).
+    snippets_sr = 48000
+    snippets = [librosa.resample(m[:sr], orig_sr=sr, target_sr=snippets_sr) if sr != snippets_sr else m
+                for m in maxima[:args.snippets]]
+    features_loop, duration_loop = timed(stack_features_loop, audio_analyzer, snippets, snippets_sr)
+    features, duration = timed(audio_analyzer.stack_features, snippets, snippets_sr)
+    assert np.allclose(features, features_loop, atol=1e-3), "stack_features output differs"
+    print("stack_features ({} snippets): loop {:.2f}s, batched {:.2f}s ({:.1f}x)".format(
+        len(snippets), duration_loop, duration, duration_loop / duration))
+
+
+if __name__ == '__main__':
+    main()
@@ -28,16 +28,22 @@ from sys import exit
 import imageio_ffmpeg
 from videoprops import get_video_properties
 import mimetypes
+from typing import Tuple
 
 from PathManager import PathManager
 from LicenseManager import LicenseManager
 from PortManager import PortManager
 from ConfigManager import ConfigManager
 from LogManager import LogManager
+from ResultCache import ResultCache
 from PlaidMLManager import PlaidMLManager
 from AudioAnalyzer.AudioAnalyzer import AudioAnalyzer
 from VideoAnalyzer.VideoAnalyzer import VideoAnalyzer
 from VideoAnalyzer.Yolo3Model import Yolo3Model
+from VideoAnalyzer.SlateClassifier import SlateClassifier
+from VideoAnalyzer.config import MODEL_PROFILES
+from VideoAnalyzer.SearchProcess import SearchProcessPool
+import multiprocessing
 
 # GUI
 from PySide2.QtWidgets import (QApplication, QProgressBar, QWidget)
@@ -63,6 +69,14 @@ import scipy._lib.messagestream
 import sklearn.tree
 
 
+# Analysis parameters. They are part of the ResultCache key, so changing them invalidates stored results.
+VIDEO_ANALYSIS_PARAMS = {'sample_seconds': 1.0, 'coarse_seconds': 2.0, 'confidence_threshold': 0.85,
+                         'max_steps': 15, 'max_retries': 2, 'prior_seconds': 30,
+                         'scan_input_size': MODEL_PROFILES['scan'], 'refine_input_size': MODEL_PROFILES['refine'],
+                         'static_threshold': 3.0}
+AUDIO_ANALYSIS_PARAMS = {'candidate_count': 64, 'fallback_confidence': 0.5, 'prior_seconds': 30}
+
+
 def exit_if_already_running():
     """Exits the program if another instance of the backend is already running."""
 
@@ -106,6 +120,9 @@ async def register_client(websocket: websockets.server.WebSocketServerProtocol):
     print("A client on port ", websocket.port, " connected")
     print("clients", clients)
 
+    # Status is only pushed on changes, so a new client gets the current one right away.
+    await websocket.send(build_status())
+
 
 def unregister_disconnected_clients():
     """Removes websocket clients that are not responding from the list of clients."""
@@ -130,6 +147,8 @@ async def send_message_to_clients(message: str):
         message: The message to be sent to all clients.
     """
 
+    unregister_disconnected_clients()
+
     for client in clients:
         await client.send(message)
 
@@ -137,6 +156,16 @@ async def send_message_to_clients(message: str):
     print(message, "\n")
 
 
+def send_message_to_clients_threadsafe(message: str):
+    """Sends a message to every client from outside the event loop, e.g. from an analysis thread.
+
+    Args:
+        message: The message to be sent to all clients.
+    """
+
+    asyncio.run_coroutine_threadsafe(send_message_to_clients(message), loop)
+
+
 async def send_possible_devices():
     """Sends possible PlaidML devices to all clients."""
 
@@ -161,32 +190,54 @@ async def send_active_device(device: str, experimental: bool = True):
     await send_message_to_clients(device)
 
 
-async def send_status():
-    """Sends current status to all clients.
+def build_status() -> str:
+    """Builds the current status message.
+
+    Status contains the total amount of tasks, the remaining amount, the tasks in progress and the device used.
 
-    Status contains the total amount of tasks, the remaining amount, the task that in progress and the device used.
+    Returns:
+        The status as JSON string.
     """
 
-    global task_current
-    global task_queue
-    global task_total
-    task_remaining = len(task_queue) if task_current == '' else len(task_queue) + 1
+    task_remaining = len(task_queue) + len(tasks_running)
+    task_current = ", ".join(tasks_running.values())
 
     status_dict = {'Statusinfo': {'totalItems': task_total,
                                   'itemsRemaining': task_remaining,
                                   'current': task_current,
                                   'activeDevice': plaidml_manager.device_active_name,
                                   'experimental': plaidml_manager.device_active_experimental}}
-    status_string = json.dumps(status_dict)
-    await send_message_to_clients(status_string)
+    return json.dumps(status_dict)
+
+
+async def send_status():
+    """Sends current status to all clients, if it has changed since it was sent last."""
+
+    global status_sent
+
+    status_string = build_status()
+    if status_string != status_sent:
+        status_sent = status_string
+        await send_message_to_clients(status_string)
+
+
+def notify_status():
+    """Requests a status update from send_status_loop. Several requests in a short time are coalesced into one."""
+
+    status_event.set()
 
 
 async def send_status_loop():
-    """Sends current status to all clients, once every second."""
+    """Sends current status to all clients, whenever notify_status() has been called.
+
+    Requests arriving within status_coalesce_seconds of each other are answered by a single status message.
+    """
 
     while True:
         try:
-            await asyncio.sleep(1)
+            await status_event.wait()
+            await asyncio.sleep(status_coalesce_seconds)
+            status_event.clear()
             await send_status()
         except:
             print("send_status_loop FAILED")
@@ -223,6 +274,7 @@ async def receive_messages(websocket, port):
 
             elif message == "RESUME":
                 paused = False
+                task_event.set()
 
             elif message == "GETDEVICES":
                 await send_possible_devices()
@@ -238,7 +290,8 @@ async def receive_messages(websocket, port):
                 for path in paths:
                     task_total += 1
                     task_queue.appendleft(path)
-            await send_status()
+                task_event.set()
+            notify_status()
 
     except websockets.exceptions.ConnectionClosedError:
         print("websocket connection closed")
@@ -264,68 +317,160 @@ def analyze_file(path: str) -> str:
     mimetype = mimetypes.guess_type(path)[0].split('/')[0]
 
     if mimetype == 'video':
+        syncpoints = result_cache.get(path, video_model_version, VIDEO_ANALYSIS_PARAMS)
+        if syncpoints is not None:
+            window.console("Stored result for Video: " + path)
+            return {path: syncpoints}
+
         window.console("Analyzing Video: " + path)
         video_analyzer = VideoAnalyzer(video_path=path,
                                        model=yolo_v3_model,
-                                       sample_rate=30,
-                                       confidence_threshold=0.85,
+                                       scan_model=yolo_v3_model.profile(VIDEO_ANALYSIS_PARAMS['scan_input_size']),
+                                       slate_classifier=slate_classifier,
+                                       static_threshold=VIDEO_ANALYSIS_PARAMS['static_threshold'],
+                                       sample_rate=None,
+                                       sample_seconds=VIDEO_ANALYSIS_PARAMS['sample_seconds'],
+                                       coarse_seconds=VIDEO_ANALYSIS_PARAMS['coarse_seconds'],
+                                       confidence_threshold=VIDEO_ANALYSIS_PARAMS['confidence_threshold'],
                                        logger=logger,
-                                       plaidml_manager=plaidml_manager)
-        syncpoints, fps, sample_rate, resolution, file_duration = video_analyzer.analyze_video(workers=4,
-                                                                                               max_steps=15,
-                                                                                               max_retries=2)
+                                       plaidml_manager=plaidml_manager,
+                                       prior_seconds=VIDEO_ANALYSIS_PARAMS['prior_seconds'],
+                                       frame_buffer_bytes=frame_buffer_bytes,
+                                       decode_mode=video_decode_mode,
+                                       hwaccel=video_hwaccel,
+                                       progress_callback=lambda event, data: send_message_to_clients_threadsafe(
+                                           json.dumps({event: {path: data}})))
+        syncpoints, fps, sample_rate, resolution, file_duration = video_analyzer.analyze_video(
+            workers=4,
+            max_steps=VIDEO_ANALYSIS_PARAMS['max_steps'],
+            max_retries=VIDEO_ANALYSIS_PARAMS['max_retries'],
+            search_pool=search_pool)
+        result_cache.set(path, video_model_version, VIDEO_ANALYSIS_PARAMS, syncpoints)
         return {path: syncpoints}
 
     elif mimetype == 'audio':
+        syncpoints = result_cache.get(path, audio_model_version, AUDIO_ANALYSIS_PARAMS)
+        if syncpoints is not None:
+            window.console("Stored result for Audio: " + path)
+            return {path: syncpoints}
+
         window.console("Analyzing Audio: " + path)
         syncpoints = audio_analyzer.analyze(path)
+        result_cache.set(path, audio_model_version, AUDIO_ANALYSIS_PARAMS, syncpoints)
         return {path: syncpoints}
 
     else:
         return {path: []}
 
 
+def get_task_kind(path: str) -> str:
+    """Returns the kind of analysis job a path needs, which decides the executor it runs in.
+
+    Args:
+        path: The path to the file that needs to be analyzed.
+
+    Returns:
+        'video' for video files, 'audio' for everything else (audio files and unsupported files).
+    """
+
+    mimetype = mimetypes.guess_type(path)[0]
+    return 'video' if mimetype is not None and mimetype.startswith('video') else 'audio'
+
+
+def pop_next_task() -> Tuple[str, str]:
+    """Removes the oldest path from the task_queue whose executor has a free slot.
+
+    Audio files do not have to wait behind a long video (and vice versa), because each kind
+    of job is limited by its own amount of workers. A path that is already being analyzed
+    (e.g. a file sent twice) stays in the queue until its running job has finished.
+
+    Returns:
+        The path and the kind of its analysis job, or (None, None) if no job can be started right now.
+    """
+
+    global task_queue
+    global tasks_running
+
+    for path in reversed(task_queue):  # paths are appended left, so the oldest one is on the right
+        if path in tasks_running:
+            continue
+        kind = get_task_kind(path)
+        running = sum(1 for running_path in tasks_running if get_task_kind(running_path) == kind)
+        if running < executor_workers[kind]:
+            task_queue.remove(path)
+            return path, kind
+
+    return None, None
+
+
+async def analyze_task(path: str, kind: str):
+    """Runs the analysis of one file in the executor of its kind and sends the result as soon as it is done.
+
+    Args:
+        path: The path to the file that needs to be analyzed.
+        kind: The kind of analysis job ('audio' or 'video').
+    """
+
+    global tasks_running
+    global task_total
+
+    try:
+        syncpoints = await loop.run_in_executor(executors[kind], analyze_file, path)
+        syncpoints = json.dumps(syncpoints)
+        await send_message_to_clients(syncpoints)
+
+    except Exception as e:
+        print("analyze_task() failed for", path)
+        print(e)
+
+    finally:
+        tasks_running.pop(path, None)
+        task_event.set()  # a worker slot is free again
+        notify_status()
+
+    if len(task_queue) == 0 and len(tasks_running) == 0:
+        await send_status()
+        await send_message_to_clients("Done")
+        window.console("Waiting for Input")
+        task_total = 0
+
+
 async def analyze_queue_loop():
-    """Periodically looks into task_queue and manages analysis jobs.
+    """Looks into task_queue and manages analysis jobs, whenever task_event is set.
 
-    Runs once a second.
-    Removes disconnected clients.
-    Checks if there is a path to process in the task_queue.
-    If there is, an appropriate analysis job is created and the queue is updated.
+    The event is set when paths are added to the task_queue, when the queue is resumed
+    and when an analysis job finishes, so new jobs start without any polling delay.
+    Starts analysis jobs for paths in the task_queue as long as the executors have free workers.
+    Audio files run in the audio executor, video files in the video (inference) executor.
+    Results are sent per file, as soon as each job finishes.
     """
 
-    global task_current
+    global tasks_running
     global paused
     global task_queue
-    global task_total
 
     while True:
 
         try:
-            unregister_disconnected_clients()
-            await asyncio.sleep(1)
+            await task_event.wait()
+            task_event.clear()
 
-            if len(task_queue) > 0 and not paused:
-                path = task_queue.pop()
-                task_current = path.split('/')[-1].split('\\')[-1]
+            while len(task_queue) > 0 and not paused:
+                path, kind = pop_next_task()
+                if path is None:
+                    break
 
-                print("Current Task: ", task_current)
-                window.console("Currently working on " + path)
+                tasks_running[path] = path.split('/')[-1].split('\\')[-1]
 
-                syncpoints = await loop.run_in_executor(None, analyze_file, path)
-                syncpoints = json.dumps(syncpoints)
-                await send_message_to_clients(syncpoints)
+                print("Current Task: ", tasks_running[path])
+                window.console("Currently working on " + path)
 
-                if len(task_queue) == 0:
-                    task_current = ""
-                    await send_status()
-                    await send_message_to_clients("Done")
-                    window.console("Waiting for Input")
-                    task_total = 0
+                asyncio.ensure_future(analyze_task(path, kind))
+                notify_status()
 
         except Exception as e:
             print("analyze_queue_loop() failed")
-            print(e.message)
+            print(e)
 
 
 ########################################################################################################################
@@ -338,6 +483,7 @@ if __name__ == '__main__':
     # Start backend
     ###############################################################################
 
+    multiprocessing.freeze_support()  # needed by the search worker processes of the PyInstaller bundle
     exit_if_already_running()
 
     path_manager = PathManager()
@@ -355,9 +501,53 @@ if __name__ == '__main__':
     ###############################################################################
 
     plaidml_manager = PlaidMLManager()
-    audio_analyzer = AudioAnalyzer(logger, plaidml_manager)
+    audio_analyzer = AudioAnalyzer(logger, plaidml_manager,
+                                   candidate_count=AUDIO_ANALYSIS_PARAMS['candidate_count'],
+                                   fallback_confidence=AUDIO_ANALYSIS_PARAMS['fallback_confidence'],
+                                   prior_seconds=AUDIO_ANALYSIS_PARAMS['prior_seconds'])
     pb_filepath = os.path.join(path_manager.get_app_path(), 'yolov3_slates.pb')
-    yolo_v3_model = Yolo3Model(pb_filepath)
+    # The slate search runs on a smaller input profile of the same graph, see VideoAnalyzer.config.MODEL_PROFILES
+    yolo_v3_model = Yolo3Model(pb_filepath, input_size=VIDEO_ANALYSIS_PARAMS['refine_input_size'])
+
+    # Optional pre-filter of the slate search, used if slate_classifier.pb is shipped next to the detector.
+    # Disable it with "videoSlateClassifier": false, "slateClassifierThreshold" trades speed for recall.
+    classifier_filepath = os.path.join(path_manager.get_app_path(), 'slate_classifier.pb')
+    slate_classifier = None
+    if config.data.get("videoSlateClassifier", True) and os.path.isfile(classifier_filepath):
+        slate_classifier = SlateClassifier(classifier_filepath,
+                                           threshold=config.data.get("slateClassifierThreshold", 0.1))
+
+    # Optional multiprocessing backend for the slate search, set "videoSearchBackend": "processes" in config.json.
+    # "videoSearchWorkers" defaults to the number of physical cores.
+    # Parallel analysis of queued files: "audioWorkers" audio files and "videoWorkers" video files at once.
+    executor_workers = {'audio': config.data.get("audioWorkers", 2),
+                        'video': config.data.get("videoWorkers", 1)}
+    executors = {kind: concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+                 for kind, workers in executor_workers.items()}
+
+    # Memory cap of the decoded frame buffer of each analyzed video, "frameBufferMegabytes" in config.json.
+    frame_buffer_bytes = config.data.get("frameBufferMegabytes", 256) * 1024 * 1024
+    # Sequential slate scans are decoded by ffmpeg at model resolution ("videoDecodeMode": "scaled"),
+    # optionally with hardware decoding ("videoHwaccel": e.g. "auto").
+    video_decode_mode = config.data.get("videoDecodeMode", "scaled")
+    video_hwaccel = config.data.get("videoHwaccel")
+    # both change which frames are decoded and how, so they are part of the ResultCache key as well
+    VIDEO_ANALYSIS_PARAMS['decode_mode'] = video_decode_mode
+    VIDEO_ANALYSIS_PARAMS['hwaccel'] = video_hwaccel
+
+    search_pool = None
+    if config.data.get("videoSearchBackend") == "processes":
+        search_pool = SearchProcessPool(pb_filepath, workers=config.data.get("videoSearchWorkers"),
+                                        classifier_path=slate_classifier.model_path if slate_classifier else None,
+                                        classifier_threshold=slate_classifier.threshold if slate_classifier else 0.1)
+
+    # Stored results of already analyzed files, invalidated by model changes.
+    # At most "resultCacheMaxFiles" results are kept, the least recently used ones are deleted first.
+    result_cache = ResultCache(max_results=config.data.get("resultCacheMaxFiles", 10000))
+    video_model_version = yolo_v3_model.model_id + ":" + result_cache.partial_hash(pb_filepath)
+    if slate_classifier is not None:
+        video_model_version += ":" + slate_classifier.model_id + ":" + result_cache.partial_hash(classifier_filepath)
+    audio_model_version = result_cache.partial_hash(audio_analyzer.path_weights)
 
     ###############################################################################
     # Global Variables
@@ -365,7 +555,7 @@ if __name__ == '__main__':
 
     task_queue = collections.deque()
     task_total = 0
-    task_current = ""
+    tasks_running = dict()  # {path: file name} of the files currently being analyzed
     paused = False
     clients = set()
 
@@ -387,6 +577,12 @@ if __name__ == '__main__':
     loop = QEventLoop(app)
     asyncio.set_event_loop(loop)
 
+    # Events replacing the former one second polling loops
+    task_event = asyncio.Event()  # set when analysis jobs may be started
+    status_event = asyncio.Event()  # set when the status may have changed
+    status_sent = ""
+    status_coalesce_seconds = config.data.get("statusCoalesceSeconds", 0.1)
+
     window = MainWindow()
     window.show()
     window.console("test")
@@ -0,0 +1,136 @@
+"""A class that stores analysis results permanently, so unchanged files do not have to be analyzed again.
+"""
+
+import os
+import json
+import hashlib
+from PathManager import PathManager
+from typing import Any, Dict, List, Optional
+
+
+class ResultCache:
+    """Analysis result storage in JSON files (one per analyzed file) inside the data path.
+
+    A result is stored under a key built from a partial content hash, the size and the modification time
+    of the analyzed file, plus the version of the model and the analysis parameters that produced it.
+    If any of these change, the key changes and the file is analyzed again.
+    Results that are no longer used are never requested again, so the directory keeps at most max_results files,
+    the least recently used ones are deleted first.
+
+    Attributes:
+        path: Path of the directory containing the result files.
+        hash_block_size: Amount of bytes read from the start, the middle and the end of a file for its content hash.
+        max_results: The maximal amount of stored result files.
+    """
+
+    def __init__(self, hash_block_size: int = 1024 * 1024, max_results: int = 10000):
+        """Initializes the ResultCache, creates its directory if needed and prunes it.
+
+        Args:
+            hash_block_size: Optional; Amount of bytes hashed at the start, middle and end of a file.
+            max_results: Optional; The maximal amount of stored result files.
+        """
+
+        self.path = PathManager().get_data_path() + "/results"
+        self.hash_block_size = hash_block_size
+        self.max_results = max_results
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        self.prune()
+
+    def partial_hash(self, file_path: str) -> str:
+        """Hashes three blocks (start, middle, end) of a file together with its size.
+
+        Media files are far too large to hash completely. Three blocks are enough to tell apart
+        two different takes, even if they have the same name and size.
+
+        Args:
+            file_path: Path of the file to hash.
+
+        Returns:
+            The hex digest of the hash.
+        """
+
+        size = os.path.getsize(file_path)
+        sha1 = hashlib.sha1(str(size).encode())
+
+        with open(file_path, 'rb') as file:
+            for offset in (0, size // 2, size - self.hash_block_size):
+                file.seek(max(0, offset))
+                sha1.update(file.read(self.hash_block_size))
+
+        return sha1.hexdigest()
+
+    def key(self, file_path: str, model_version: str, params: Dict[str, Any]) -> str:
+        """Builds the key of an analysis result.
+
+        Args:
+            file_path: Path of the analyzed file.
+            model_version: Identifies the model used for the analysis (see partial_hash of the model file).
+            params: The analysis parameters: {"sample_rate": 30, ...}.
+
+        Returns:
+            The key, a hex digest.
+        """
+
+        stat = os.stat(file_path)
+        fingerprint = {"content": self.partial_hash(file_path),
+                       "size": stat.st_size,
+                       "mtime": stat.st_mtime,
+                       "model": model_version,
+                       "params": params}
+        return hashlib.sha1(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()
+
+    def get(self, file_path: str, model_version: str, params: Dict[str, Any]) -> Optional[List[float]]:
+        """Retrieves the stored sync points of a file.
+
+        Args:
+            file_path: Path of the analyzed file.
+            model_version: Identifies the model used for the analysis.
+            params: The analysis parameters.
+
+        Returns:
+            The stored sync points or None if the file (in its current state) has not been analyzed before.
+        """
+
+        try:
+            result_path = os.path.join(self.path, self.key(file_path, model_version, params) + ".json")
+            if not os.path.exists(result_path):
+                return None
+
+            with open(result_path) as json_file:
+                syncpoints = json.load(json_file)["syncpoints"]
+            os.utime(result_path)  # marks the result as recently used for prune
+            return syncpoints
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def set(self, file_path: str, model_version: str, params: Dict[str, Any], syncpoints: List[float]):
+        """Stores the sync points of a file.
+
+        Args:
+            file_path: Path of the analyzed file.
+            model_version: Identifies the model used for the analysis.
+            params: The analysis parameters.
+            syncpoints: The sync points found during the analysis.
+        """
+
+        result_path = os.path.join(self.path, self.key(file_path, model_version, params) + ".json")
+        with open(result_path, 'w') as outfile:
+            json.dump({"file": file_path, "syncpoints": syncpoints}, outfile, indent=4)
+        self.prune()
+
+    def prune(self):
+        """Deletes the least recently used result files exceeding max_results."""
+
+        try:
+            entries = [entry for entry in os.scandir(self.path) if entry.name.endswith(".json")]
+            if len(entries) <= self.max_results:
+                return
+
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:len(entries) - self.max_results]:
+                os.remove(entry.path)
+        except OSError as e:
+            print("ResultCache.prune() failed")
+            print(e)
@@ -0,0 +1,162 @@
+"""A class that reads decoded frames of a video file and keeps the most recent ones in a bounded ring buffer.
+"""
+
+import cv2
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List
+
+
+class FrameSource:
+    """Reads frames of one video file by frame number, decoding each of them at most once while it is buffered.
+
+    Frames are read in ascending order where possible. A frame at most max_grab_gap frames in front of the
+    capture position is reached by skipping the frames in between with grab(), since seeking on inter-coded video
+    decodes from the previous keyframe. Retrieved frames are kept in a ring buffer of at most max_bytes,
+    the least recently used frames are dropped first.
+    Not thread-safe: every thread has to use its own FrameSource.
+    Usage inside the VideoAnalyzer:
+    frame_source = FrameSource(video_path, max_grab_gap=8)
+    image = frame_source.read(420)
+
+    Attributes:
+        video_path: Path of the video file.
+        cap: The OpenCV VideoCapture object decoding the file.
+        frame_count: The amount of frames of the file, frames outside of [0, frame_count) are never decoded.
+            0 if the container does not tell.
+        max_bytes: The maximal size of all buffered frames together. 0 disables the buffer.
+        max_grab_gap: Frames at most this far in front of the capture position are reached without seeking.
+        buffer: The buffered frames {frame_number: image, ...} in order of their last use.
+        buffer_bytes: The size of all buffered frames together.
+        position: The index of the frame the capture will decode next. None if unknown.
+        decodes: Amount of frames decoded, including the ones skipped with grab().
+        seeks: Amount of times the capture position has been set.
+        hits: Amount of frames returned from the buffer.
+    """
+
+    def __init__(self, video_path: str, max_bytes: int = 256 * 1024 * 1024, max_grab_gap: int = 16):
+        """Opens the video file.
+
+        Args:
+            video_path: Path of the video file.
+            max_bytes: Optional; The maximal size of all buffered frames together. 0 disables the buffer.
+            max_grab_gap: Optional; Frames at most this far in front of the capture position are reached
+                by decoding forward instead of seeking.
+        """
+
+        self.video_path = video_path
+        self.cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
+        self.frame_count = max(0, int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        self.max_bytes = max_bytes
+        self.max_grab_gap = max_grab_gap
+        self.buffer = OrderedDict()
+        self.buffer_bytes = 0
+        self.position = None
+        self.decodes = 0
+        self.seeks = 0
+        self.hits = 0
+
+    def get(self, prop_id: int) -> float:
+        """Returns a property of the capture, like cv2.VideoCapture.get."""
+
+        return self.cap.get(prop_id)
+
+    def read(self, frame_number: int) -> np.ndarray:
+        """Returns a single frame.
+
+        Args:
+            frame_number: The frame to read.
+
+        Returns:
+            The image or None if the frame could not be read.
+        """
+
+        return self.read_frames([frame_number])[frame_number]
+
+    def read_frames(self, frame_numbers: List[int]) -> Dict[int, np.ndarray]:
+        """Returns frames from the buffer or decodes them in ascending order, seeking once per contiguous window.
+
+        Args:
+            frame_numbers: The frames to read.
+
+        Returns:
+            A dict with the images {frame_number: image, ...}. An image is None if the frame could not be read,
+            e.g. frames before the first or after the last frame of the file.
+        """
+
+        images = dict()
+        for frame_number in sorted(set(frame_numbers)):
+            if frame_number < 0 or 0 < self.frame_count <= frame_number:
+                images[frame_number] = None
+                continue
+
+            if frame_number in self.buffer:
+                self.buffer.move_to_end(frame_number)
+                images[frame_number] = self.buffer[frame_number]
+                self.hits += 1
+                continue
+
+            images[frame_number] = self.decode(frame_number)
+            self.store(frame_number, images[frame_number])
+
+        return images
+
+    def decode(self, frame_number: int) -> np.ndarray:
+        """Decodes a frame, seeking only if it is behind or too far in front of the capture position.
+
+        Args:
+            frame_number: The frame to decode.
+
+        Returns:
+            The image or None if the frame could not be read.
+            The capture position is only trusted again after a successful seek or grab.
+        """
+
+        if self.position is None or not 0 <= frame_number - self.position <= self.max_grab_gap:
+            self.seeks += 1
+            if frame_number < 0 or not self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number):
+                self.position = None
+                return None
+            self.position = frame_number
+
+        while self.position < frame_number:
+            if not self.cap.grab():
+                self.position = None
+                return None
+            self.position += 1
+            self.decodes += 1
+
+        _, image = self.cap.read()
+        self.position = frame_number + 1 if image is not None else None
+        self.decodes += 1
+        return image
+
+    def store(self, frame_number: int, image: np.ndarray):
+        """Adds a frame to the buffer and drops the least recently used frames exceeding max_bytes.
+
+        Args:
+            frame_number: The number of the frame.
+            image: The image of the frame.
+        """
+
+        if image is None or image.nbytes > self.max_bytes:
+            return
+
+        self.buffer[frame_number] = image
+        self.buffer_bytes += image.nbytes
+        while self.buffer_bytes > self.max_bytes:
+            _, dropped = self.buffer.popitem(last=False)
+            self.buffer_bytes -= dropped.nbytes
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the decode, seek and buffer hit counters, e.g. for logging."""
+
+        return {"decodes": self.decodes, "seeks": self.seeks, "hits": self.hits, "buffered": len(self.buffer)}
+
+    def release(self):
+        """Releases the capture and empties the buffer."""
+
+        self.cap.release()
+        self.buffer.clear()
+        self.buffer_bytes = 0
+        self.position = None
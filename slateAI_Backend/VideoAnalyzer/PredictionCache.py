@@ -0,0 +1,92 @@
+"""A class that caches model predictions of single video frames.
+"""
+
+import threading
+import collections
+from typing import Any, Dict, Tuple
+
+
+class PredictionCache:
+    """A bounded LRU cache of model outputs for the frames of one video file.
+
+    The jump search, the binary search and the padding of the SyncpointDetector all infer frames
+    of the same file, often the same ones. Every prediction is stored under (file, frame_number, model_id),
+    so a frame is infered at most once per model as long as it has not been evicted.
+    The cache is shared by all search threads and therefore guarded by a lock.
+
+    Attributes:
+        video_path: Path of the video file the cached predictions belong to.
+        max_size: Maximal amount of cached predictions. The least recently used one is evicted first.
+        hits: Amount of lookups that were answered from the cache.
+        misses: Amount of lookups that needed inference.
+        entries: The cached predictions: OrderedDict{(file, frame_number, model_id): prediction, ...}.
+        lock: The lock guarding entries and counters.
+    """
+
+    def __init__(self, video_path: str, max_size: int = 4096):
+        """Initializes an empty cache for the video file from param.
+
+        Args:
+            video_path: Path of the video file the cached predictions belong to.
+            max_size: Optional; Maximal amount of cached predictions.
+        """
+
+        self.video_path = video_path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def key(self, frame_number: int, model_id: str) -> Tuple[str, int, str]:
+        """Returns the cache key of a frame: (file, frame_number, model_id)."""
+
+        return self.video_path, int(frame_number), model_id
+
+    def get(self, frame_number: int, model_id: str) -> Any:
+        """Looks up the prediction of a frame and counts a hit or a miss.
+
+        Args:
+            frame_number: The frame in question.
+            model_id: The id of the model that made the prediction.
+
+        Returns:
+            The cached prediction or None if the frame has not been infered (or has been evicted).
+        """
+
+        key = self.key(frame_number, model_id)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, frame_number: int, model_id: str, prediction: Any):
+        """Stores the prediction of a frame, evicting the least recently used one if the cache is full.
+
+        Args:
+            frame_number: The frame that was infered.
+            model_id: The id of the model that made the prediction.
+            prediction: The model output for the frame.
+        """
+
+        key = self.key(frame_number, model_id)
+        with self.lock:
+            self.entries[key] = prediction
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def predictions(self, model_id: str) -> Dict[int, Any]:
+        """Returns all cached predictions of a model: {frame_number: prediction, ...}."""
+
+        with self.lock:
+            return {key[1]: prediction for key, prediction in self.entries.items() if key[2] == model_id}
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the hit/miss counters and the current size of the cache."""
+
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
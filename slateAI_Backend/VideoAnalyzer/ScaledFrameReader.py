@@ -0,0 +1,111 @@
+"""A class that decodes sampled frames of a video file with ffmpeg, downscaled to the model resolution.
+"""
+
+import subprocess
+import imageio_ffmpeg
+import numpy as np
+from typing import Iterator, List, Tuple
+
+
+class ScaledFrameReader:
+    """Reads every (stride)th frame of a range of a video file through an ffmpeg pipe, already downscaled.
+
+    ffmpeg decodes the range once from start to end, drops the frames in between samples with a select filter
+    and scales the samples down so they fit into the model input (keeping the aspect ratio, like
+    image_preporcess does). The raw bgr24 frames are read from the pipe into preallocated buffers, so neither
+    full resolution (4K/6K) frames nor new arrays per frame are created in Python.
+    The yielded images are views into a ring of buffers and are overwritten after (buffer_count) more frames.
+    Copy them if they are needed longer.
+    Usage inside the VideoAnalyzer:
+    reader = ScaledFrameReader(video_path, fps, resolution, target_size=544)
+    for frame_number, image in reader.read((0, 1000), stride=30): ...
+
+    Attributes:
+        video_path: Path of the video file.
+        fps: The frames per second of the video file.
+        width: The width of the decoded frames.
+        height: The height of the decoded frames.
+        hwaccel: The ffmpeg hardware decoding method (e.g. 'auto', 'videotoolbox', 'dxva2') or None.
+        buffers: The preallocated frame buffers (height x width x 3, uint8).
+    """
+
+    def __init__(self, video_path: str, fps: float, resolution: List[float], target_size: int,
+                 hwaccel: str = None, buffer_count: int = 8):
+        """Computes the size of the decoded frames and allocates the buffers.
+
+        Args:
+            video_path: Path of the video file.
+            fps: The frames per second of the video file.
+            resolution: The spacial resolution [width, height] of the video file.
+            target_size: The input size of the model. Frames are scaled down to fit into a square of this size.
+                Smaller frames keep their resolution.
+            hwaccel: Optional; The ffmpeg hardware decoding method. None decodes in software.
+            buffer_count: Optional; The amount of buffers the yielded images rotate through.
+        """
+
+        self.video_path = video_path
+        self.fps = fps
+        scale = min(1., target_size / resolution[0], target_size / resolution[1])
+        self.width = max(2, int(scale * resolution[0]) // 2 * 2)  # even sizes for all ffmpeg pixel formats
+        self.height = max(2, int(scale * resolution[1]) // 2 * 2)
+        self.hwaccel = hwaccel
+        self.buffers = [np.empty((self.height, self.width, 3), dtype=np.uint8) for _ in range(buffer_count)]
+
+    def read(self, chunk: Tuple[int, int], stride: int) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yields every (stride)th frame of the chunk, downscaled.
+
+        Args:
+            chunk: A tuple containing the start and end frame numbers of the chunk to be read.
+            stride: The step size between the yielded frames.
+
+        Yields:
+            Tuples of (frame_number, image).
+        """
+
+        frame_numbers = range(chunk[0], chunk[1], stride)
+        if len(frame_numbers) == 0:
+            return
+
+        command = [imageio_ffmpeg.get_ffmpeg_exe(), '-hide_banner', '-nostats', '-loglevel', 'error']
+        if self.hwaccel:
+            command += ['-hwaccel', self.hwaccel]
+        # half a frame in front of the first one, so rounding never drops it
+        command += ['-ss', str(max(0., (chunk[0] - .5) / self.fps)), '-i', self.video_path,
+                    '-an', '-sn', '-vf', "select='not(mod(n\\,{}))',scale={}:{}:flags=bilinear".format(
+                        stride, self.width, self.height),
+                    '-vsync', '0', '-frames:v', str(len(frame_numbers)),
+                    '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-']
+
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                   bufsize=self.buffers[0].nbytes)
+        try:
+            for i, frame_number in enumerate(frame_numbers):
+                image = self.buffers[i % len(self.buffers)]
+                if not self.read_into(process.stdout, image):
+                    return
+                yield frame_number, image
+        finally:
+            process.kill()
+            process.stdout.close()
+            process.wait()
+
+    @staticmethod
+    def read_into(stream, buffer: np.ndarray) -> bool:
+        """Fills a buffer from a pipe, which can return less bytes than requested per read.
+
+        Args:
+            stream: The binary stream to read from.
+            buffer: The array to fill.
+
+        Returns:
+            False if the stream ended before the buffer was full.
+        """
+
+        view = memoryview(buffer.reshape(-1))
+        filled = 0
+        while filled < len(view):
+            count = stream.readinto(view[filled:])
+            if not count:
+                return False
+            filled += count
+        return True
@@ -0,0 +1,156 @@
+"""A class for multi-processing jump search tasks.
+"""
+
+import multiprocessing
+import os
+import psutil
+import tensorflow as tf
+from VideoAnalyzer.Yolo3Model import Yolo3Model
+from VideoAnalyzer.SlateClassifier import SlateClassifier
+from typing import List, Tuple, Dict
+
+# The slate confidences, the states of all sampled frames and the search_stats of a search (see VideoAnalyzer).
+SearchResult = Tuple[Dict[int, float], Dict[int, Tuple[bool, int, float]], Dict[str, int]]
+
+# The model and the optional SlateClassifier of a worker process. Loaded once per process by init_worker().
+worker_model = None
+worker_classifier = None
+
+
+def init_worker(model_path: str, classifier_path: str = None, classifier_threshold: float = 0.1):
+    """Loads the frozen model (and classifier) once inside a freshly started worker process.
+
+    Every worker runs its own single threaded session, so the workers do not compete for the same cores.
+
+    Args:
+        model_path: Path of the frozen graph (yolov3_slates.pb).
+        classifier_path: Optional; Path of the frozen SlateClassifier graph (slate_classifier.pb).
+        classifier_threshold: Optional; The threshold of the SlateClassifier.
+    """
+
+    global worker_model, worker_classifier
+    session_config = tf.ConfigProto(intra_op_parallelism_threads=1, inter_op_parallelism_threads=1)
+    worker_model = Yolo3Model(model_path, session_config=session_config)
+    if classifier_path is not None:
+        worker_classifier = SlateClassifier(classifier_path, threshold=classifier_threshold,
+                                            session_config=session_config)
+
+
+def search_chunk(video_path: str, chunk: Tuple[int, int], sample_rate: int, confidence_threshold: float,
+                 scan_mode: str, decode_mode: str, hwaccel: str, input_size: int, static_threshold: float,
+                 worker_id: int) -> SearchResult:
+    """Performs jump search within one chunk of a video file inside a worker process.
+
+    The worker opens and decodes the chunk on its own, so only predictions have to be sent back to the main process.
+
+    Args:
+        video_path: Path of the video file in need of analysis.
+        chunk: A tuple containing the start and end frame numbers of the chunk to be analyzed.
+        sample_rate: The step size while looking for slates in frames. Every (sample_rate)th will be analyzed.
+        confidence_threshold: Minimal confidence needed to categorize an image as having a slate in it.
+        scan_mode: How frames are read during the jump search: 'seek' or 'sequential'.
+        decode_mode: 'capture' or 'scaled' (see VideoAnalyzer).
+        hwaccel: The ffmpeg hardware decoding method for the 'scaled' decode_mode or None.
+        input_size: The input size of the model profile to search with (see Yolo3Model.profile).
+        static_threshold: The static frame threshold of the search or None (see VideoAnalyzer).
+        worker_id: A unique number identifying the chunk/worker.
+
+    Returns:
+        A dict with the slate confidences {frame_number: confidence, ...}
+        and a dict with the states of all sampled frames
+        {frame_number: (has_slate, class_index, confidence), ...}
+        and the search_stats of the chunk (see VideoAnalyzer).
+    """
+
+    # Imported here because VideoAnalyzer imports this module.
+    from VideoAnalyzer.VideoAnalyzer import VideoAnalyzer
+
+    model = worker_model.profile(input_size)
+    video_analyzer = VideoAnalyzer(video_path=video_path, model=model, sample_rate=sample_rate,
+                                   confidence_threshold=confidence_threshold, logger=None, plaidml_manager=None,
+                                   scan_mode=scan_mode, decode_mode=decode_mode, hwaccel=hwaccel,
+                                   slate_classifier=worker_classifier, static_threshold=static_threshold)
+    predictions = dict()
+    video_analyzer.jump_search(chunk, worker_id, predictions, 0)
+    video_analyzer.frame_source.release()
+    return predictions, video_analyzer.prediction_cache.predictions(model.model_id), video_analyzer.search_stats
+
+
+class SearchProcessPool:
+    """A pool of worker processes that run jump search tasks outside of the GIL.
+
+    Each worker process loads the frozen model once at startup and keeps it for the lifetime of the pool,
+    so the pool should be created once and reused for every video file.
+    Usage inside the Backend:
+    search_pool = SearchProcessPool(pb_filepath)
+    video_analyzer.analyze_video(workers=4, max_steps=15, max_retries=2, search_pool=search_pool)
+
+    Attributes:
+        model_path: Path of the frozen graph loaded by every worker.
+        classifier_path: Path of the frozen SlateClassifier graph loaded by every worker or None.
+        workers: Amount of worker processes.
+        pool: The multiprocessing pool running the workers.
+    """
+
+    def __init__(self, model_path: str, workers: int = None, classifier_path: str = None,
+                 classifier_threshold: float = 0.1):
+        """Starts the worker processes.
+
+        Args:
+            model_path: Path of the frozen graph (yolov3_slates.pb).
+            workers: Optional; Amount of worker processes. Defaults to the number of physical cores.
+            classifier_path: Optional; Path of a frozen SlateClassifier graph. If given, the workers only run the
+                model on the sampled frames the classifier does not reject.
+            classifier_threshold: Optional; The threshold of the SlateClassifier.
+        """
+
+        self.model_path = model_path
+        self.classifier_path = classifier_path
+        self.workers = workers or psutil.cpu_count(logical=False) or os.cpu_count()
+        # "spawn" avoids forking a process that already holds an initialized TensorFlow runtime.
+        context = multiprocessing.get_context('spawn')
+        self.pool = context.Pool(processes=self.workers, initializer=init_worker,
+                                 initargs=(model_path, classifier_path, classifier_threshold))
+
+    def search(self, video_path: str, chunks: List[Tuple[int, int]], sample_rate: int,
+               confidence_threshold: float, scan_mode: str, decode_mode: str = 'capture',
+               hwaccel: str = None, input_size: int = 544, static_threshold: float = None) -> SearchResult:
+        """Searches all chunks of a video file in parallel and merges the results.
+
+        Args:
+            video_path: Path of the video file in need of analysis.
+            chunks: A list of (start, end) frame number tuples, one task per chunk.
+            sample_rate: The step size while looking for slates in frames. Every (sample_rate)th will be analyzed.
+            confidence_threshold: Minimal confidence needed to categorize an image as having a slate in it.
+            scan_mode: How frames are read during the jump search: 'seek' or 'sequential'.
+            decode_mode: Optional; 'capture' or 'scaled' (see VideoAnalyzer).
+            hwaccel: Optional; The ffmpeg hardware decoding method for the 'scaled' decode_mode.
+            input_size: Optional; The input size of the model profile to search with (see Yolo3Model.profile).
+            static_threshold: Optional; The static frame threshold of the search (see VideoAnalyzer).
+
+        Returns:
+            A dict with the slate confidences {frame_number: confidence, ...}
+            and a dict with the states of all sampled frames
+            {frame_number: (has_slate, class_index, confidence), ...}
+            and the summed search_stats of all chunks (see VideoAnalyzer).
+        """
+
+        tasks = [(video_path, chunk, sample_rate, confidence_threshold, scan_mode, decode_mode, hwaccel, input_size,
+                  static_threshold, i)
+                 for i, chunk in enumerate(chunks)]
+
+        predictions = dict()
+        sampled_predictions = dict()
+        search_stats = dict()
+        for chunk_predictions, chunk_sampled_predictions, chunk_stats in self.pool.starmap(search_chunk, tasks):
+            predictions.update(chunk_predictions)
+            sampled_predictions.update(chunk_sampled_predictions)
+            for key, count in chunk_stats.items():
+                search_stats[key] = search_stats.get(key, 0) + count
+        return predictions, sampled_predictions, search_stats
+
+    def terminate(self):
+        """Stops all worker processes."""
+
+        self.pool.terminate()
+        self.pool.join()
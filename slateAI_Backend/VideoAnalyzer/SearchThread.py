@@ -21,12 +21,13 @@ class SearchThread(threading.Thread):
         predictions: A dict containing the predicted confidences for each analyzed frame: {frame_number: confidence,...}
         video_analyzer: The VideoAnalyzer object of the file in question.
         steps_done: Amount of frames analyzed. Starts at 0, ends at video_analyzer.sample_rate.
+        stride: The step size of the jump search. None uses video_analyzer.sample_rate.
         start = Timestamp, when the thread has been started running.
         end = Timestamp, when the thread has finished running.
     """
 
     def __init__(self, thread_id: int, chunk: Tuple[int, int], predictions: Dict[int, float],
-                 video_analyzer, steps_done: int):
+                 video_analyzer, steps_done: int, stride: int = None):
         """Initializes the thread and most of its attributes.
 
         Args:
@@ -37,6 +38,7 @@ class SearchThread(threading.Thread):
             video_analyzer: The VideoAnalyzer object of the file in question.
                 (No type hinting because of errors due to recursive class imports).
             steps_done: Amount of frames analyzed. Starts at 0, ends at video_analyzer.sample_rate.
+            stride: Optional; The step size of the jump search. Defaults to video_analyzer.sample_rate.
         """
 
         threading.Thread.__init__(self)
@@ -45,6 +47,7 @@ class SearchThread(threading.Thread):
         self.predictions = predictions
         self.video_analyzer = video_analyzer
         self.steps_done = steps_done
+        self.stride = stride
 
     def terminate(self):
         """Terminates the thread."""
@@ -59,6 +62,7 @@ class SearchThread(threading.Thread):
 
         self.start = time.time()
         print("Starting SearchThread {}".format(self.thread_id))
-        self.video_analyzer.jump_search(self.chunk, self.thread_id, self.predictions, self.steps_done)
+        self.video_analyzer.jump_search(self.chunk, self.thread_id, self.predictions, self.steps_done,
+                                       self.stride)
         print("Thread {} Done".format(self.thread_id))
         self.end = time.time()
\ No newline at end of file
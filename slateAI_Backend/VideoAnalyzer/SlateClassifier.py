@@ -0,0 +1,79 @@
+"""A class that tells whether a slate is visible in video frames at all, as a cheap pre-filter for the detector.
+"""
+
+import os
+import threading
+import numpy as np
+import tensorflow as tf
+import VideoAnalyzer.core.utils as utils
+from typing import List
+
+
+class SlateClassifier:
+    """A small MobileNetV2 classifier (see videoclap/train_classifier.py) predicting the probability of a slate.
+
+    The slate search only runs the detector on frames the classifier does not reject, most sampled frames of a
+    take show no slate. The frozen graph takes letterboxed frames like the detector (see utils.image_preporcess),
+    its input size is read from the graph.
+    Usage inside the VideoAnalyzer:
+    slate_classifier = SlateClassifier(classifier_path, threshold=0.1)
+    flags = slate_classifier.flag_batch(images)
+
+    Attributes:
+        model_path: Path of the frozen graph (slate_classifier.pb).
+        model_id: Identifies the classifier and its threshold, e.g. for the ResultCache.
+        threshold: Frames with a slate probability below this are rejected.
+            Low values trade speed for recall.
+        graph: The TensorFlow graph of the classifier.
+        return_tensors: The input and the output tensor of the graph.
+        input_size: The width and height of the input frames.
+        sess: The TensorFlow session running the graph.
+        buffers: The reusable float32 input buffers, one per thread.
+    """
+
+    def __init__(self, model_path: str, threshold: float = 0.1, session_config: tf.ConfigProto = None):
+        """Loads the frozen graph.
+
+        Args:
+            model_path: Path of the frozen graph (slate_classifier.pb).
+            threshold: Optional; Frames with a slate probability below this are rejected.
+            session_config: Optional; The configuration of the TensorFlow session.
+        """
+
+        self.model_path = model_path
+        self.model_id = "{}>{}".format(os.path.basename(model_path), threshold)
+        self.threshold = threshold
+        self.graph = tf.Graph()
+        self.return_tensors = utils.read_pb_return_tensors(self.graph, model_path,
+                                                           ["input_data:0", "slate_prob/Sigmoid:0"])
+        self.input_size = int(self.return_tensors[0].shape[1])
+        self.sess = tf.Session(graph=self.graph, config=session_config)
+        self.buffers = threading.local()
+
+    def predict_batch(self, images: List[np.ndarray]) -> np.ndarray:
+        """Runs one session call on a batch of frames.
+
+        Args:
+            images: The frames (BGR, any size).
+
+        Returns:
+            The slate probability of each frame.
+        """
+
+        if len(images) == 0:
+            return np.zeros(0)
+
+        buffer = getattr(self.buffers, 'input_data', None)
+        if buffer is None or len(buffer) < len(images):
+            buffer = np.empty((len(images), self.input_size, self.input_size, 3), dtype=np.float32)
+            self.buffers.input_data = buffer
+        image_data = buffer[:len(images)]
+        for i, image in enumerate(images):
+            utils.image_preporcess(image, [self.input_size, self.input_size], out=image_data[i])
+
+        return self.sess.run(self.return_tensors[1], feed_dict={self.return_tensors[0]: image_data})[:, 0]
+
+    def flag_batch(self, images: List[np.ndarray]) -> np.ndarray:
+        """Returns a boolean array, True for each frame that may contain a slate."""
+
+        return self.predict_batch(images) >= self.threshold
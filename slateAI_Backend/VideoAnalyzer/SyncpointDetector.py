@@ -5,7 +5,9 @@ import cv2
 import numpy as np
 from VideoAnalyzer.config import CLASS_INDEX_DICT
 from VideoAnalyzer.Yolo3Model import Yolo3Model
-from typing import List, Tuple, Dict, Any, Union
+from VideoAnalyzer.PredictionCache import PredictionCache
+from VideoAnalyzer.FrameSource import FrameSource
+from typing import List, Tuple, Dict, Any, Union, Callable
 
 
 class SyncpointDetector:
@@ -15,32 +17,37 @@ class SyncpointDetector:
         confidence_margin:
         confidence_threshold: Minimal confidence needed to categorize an image as having an open/closed slate in it.
         model: The machine learning model used for inference.
-        cap: An OpenCV VideoCapture object for the file.
+        frame_source: The FrameSource of the file, shared with the VideoAnalyzer.
         sample_rate: The step size used by the VideoAnalyzer while looking for slates in frames.
             Every (sample_rate)th frame was analyzed. Used here to extend/pad the borders of a "slate group"
             by one sample in each direction.
+        prediction_cache: The PredictionCache shared with the VideoAnalyzer. Frames found in it under the model_id
+            of model are not infered again.
     """
 
     def __init__(self, confidence_margin: int, confidence_threshold: float,
-                 model: Yolo3Model, cap: cv2.VideoCapture, sample_rate: int):
+                 model: Yolo3Model, frame_source: FrameSource, sample_rate: int,
+                 prediction_cache: PredictionCache = None):
         """Initializes the SyncPointDetector and its class attributes."""
 
         self.confidence_margin = confidence_margin
         self.confidence_threshold = confidence_threshold
         self.model = model
-        self.cap = cap
+        self.frame_source = frame_source
         self.sample_rate = sample_rate
+        self.prediction_cache = prediction_cache if prediction_cache is not None else PredictionCache("")
 
-    def find_all_syncpoints_binary(self, groups: List[List[int]],
-                                   max_steps: int = 20, max_retries: int = 3) -> List[int]:
+    def find_all_syncpoints_binary(self, groups: List[List[int]], max_steps: int = 20, max_retries: int = 3,
+                                   on_syncpoint: Callable[[int], None] = None) -> List[int]:
         """For each group of consecutive slate-containing frames the exact sync points (slate is closed) are found.
 
-        Each group is searched in a binary manner until a sync point can be found, using syncpoint_search_fast.
+        Each group is searched by bisection until a sync point can be found, using syncpoint_search_fast.
 
         Args:
             groups: A list of lists/groups to look for sync points in.
-            max_steps: Maximal amount of recursive steps the binary search will make while searching in a slate group.
+            max_steps: Maximal amount of bisection steps per search attempt in a slate group.
             max_retries: Maximal amount of times a slate group will be searched for sync points.
+            on_syncpoint: Optional; Called with each found sync point (frame number) as soon as its group is done.
 
         Returns:
             A list of found slate sync points, each as frame numbers.
@@ -55,6 +62,9 @@ class SyncpointDetector:
             syncpoint = self.syncpoint_search_fast(first_frame, last_frame, max_steps, max_retries)
             syncpoints.append(syncpoint)
 
+            if on_syncpoint is not None and syncpoint is not None:
+                on_syncpoint(syncpoint)
+
             print("Syncpoint = {}".format(syncpoint))
             print("-" * 100)
 
@@ -62,210 +72,268 @@ class SyncpointDetector:
 
     def syncpoint_search_fast(self, first_frame_number: int, last_frame_number: int,
                               max_steps: int = 20, max_retries: int = 3) -> int:
-        """The slate group defined by first_frame_number and last_frame_number is widened and sent to the binary search.
+        """The slate group defined by first_frame_number and last_frame_number is widened and sent to the bracket search.
 
         The frame group borders are extended bs sample_rate in each direction.
         Example: With a sample_rate of 30 a group defined by frames 69 and 420 grows to include frames 39 - 450.
-        This is the initial starting point of the binary search algorithm. The 1st frame to analyze is determined here.
+        These borders form the initial open -> closed bracket of syncpoint_bracket_search.
 
         Args:
             first_frame_number: Index of the first frame of the group to analyze.
             last_frame_number: Index of the last frame of the group to analyze.
-            max_steps: Maximal amount of recursive steps the binary search will make while searching in a slate group.
+            max_steps: Maximal amount of bisection steps per search attempt in a slate group.
             max_retries: Maximal amount of times a slate group will be searched for sync points.
 
         Returns:
             The sync point found within the group.
         """
 
-        total_number_of_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        total_number_of_frames = int(self.frame_source.get(cv2.CAP_PROP_FRAME_COUNT))
 
         first_frame_number -= self.sample_rate
         first_frame_number = 0 if first_frame_number < 0 else first_frame_number
 
         last_frame_number += self.sample_rate
-        last_frame_number = total_number_of_frames if last_frame_number > total_number_of_frames \
-            else total_number_of_frames
+        last_frame_number = min(last_frame_number, total_number_of_frames - 1)
 
         print("Searching frames {} - {}".format(first_frame_number, last_frame_number))
 
-        step_size = (last_frame_number - first_frame_number) // 2
-        frame_number = last_frame_number - step_size
+        return self.syncpoint_bracket_search(first_frame_number, last_frame_number, max_steps, max_retries)
 
-        return self.syncpoint_binary_search(first_frame_number, last_frame_number, frame_number,
-                                            step_size, step_size, max_steps, max_retries)
+    def syncpoint_bracket_search(self, first_frame: int, last_frame: int, max_steps: int, max_retries: int) -> int:
+        """Iteratively searches for the frame where the slate is closed by bisecting open -> closed brackets.
 
-    def syncpoint_binary_search(self, first_frame: int, last_frame: int, frame_number: int, step_size: int,
-                                original_step_size: int, max_steps: int, max_retries: int) -> int:
-        """Recursively searches for the frame where the slate is closed in a binary manner.
+        Every infered frame is kept in a map of observations {frame_number: (class_index, confidence)}.
+        The borders of the group are assumed to be open (first_frame) and closed (last_frame) without infering them.
+        Each step infers the middle of the tightest bracket: two neighbouring observations, the earlier one open
+        and the later one closed. As soon as such a bracket is only one frame wide, the candidate is verified with
+        pad_final_prediction. A rejected candidate does not restart the search: its padded frames are added to the
+        observations and the next tightest bracket is searched. If there is none, the widest gap between two
+        observations is bisected. The search is therefore deterministic and never infers a frame twice.
 
         Args:
             first_frame: Index of the first frame of the group.
-            last_frame: Index of the last frame of group.
-            frame_number: Index of the frame in the middle, the one that will be analyzed in this iteration.
-            step_size: Indicates how many frames lie in between the last analysed frame and this one.
-            max_steps: Amount of recursive steps left before the binary search auto-finishes.
-            max_retries: Maximal amount of times the group will be searched.
-        """
+            last_frame: Index of the last frame of the group.
+            max_steps: Maximal amount of bisection steps per search attempt.
+            max_retries: Maximal amount of rejected candidates before the likeliest one is returned.
 
-        print("Frame = {}".format(frame_number))
-        print("Step Size = {}".format(step_size))
+        Returns:
+            The sync point (index of the last open frame).
+        """
 
-        if max_steps == 0:
-            return
+        open_idx = CLASS_INDEX_DICT['open']
+        closed_idx = CLASS_INDEX_DICT['closed']
+        observations = {first_frame: (open_idx, 0.), last_frame: (closed_idx, 0.)}
+        rejected = set()
+        retries = 0
+        steps = 0
+
+        while steps < max_steps:
+            brackets = [bracket for bracket in self.find_brackets(observations) if bracket not in rejected]
+
+            if len(brackets) == 0:  # no transition left, explore the widest gap between observations instead
+                frames = sorted(observations.keys())
+                gap_start, gap_end = max(zip(frames[:-1], frames[1:]), key=lambda gap: gap[1] - gap[0])
+                if gap_end - gap_start <= 1:
+                    break
+                self.observe((gap_start + gap_end) // 2, gap_start, gap_end, observations)
+                steps += 1
+                continue
+
+            open_frame, closed_frame = min(brackets, key=lambda bracket: (
+                bracket[1] - bracket[0], -(observations[bracket[0]][1] + observations[bracket[1]][1])))
+
+            if closed_frame - open_frame > 1:
+                self.observe((open_frame + closed_frame) // 2, open_frame, closed_frame, observations)
+                steps += 1
+                continue
+
+            padded_indexes = self.pad_final_prediction(frame_number=open_frame)
+            for frame_number, class_idx, conf in padded_indexes:
+                observations[int(frame_number)] = (int(class_idx), float(conf or 0.))
 
-        if step_size == 1:
-            max_steps -= 1
+            syncpoint = self.improved_syncpoint_detection(padded_indexes[:, 0],
+                                                          padded_indexes[:, 1],
+                                                          padded_indexes[:, 2])
+            if syncpoint is not None:
+                return syncpoint
 
-        predictions = self.make_predictions(frame_number)
-        class_indexes = self.get_class_indexes(predictions)
+            if retries == max_retries:
+                print("Max. retries reached. Returning most likely sync point")
+                return open_frame
 
-        if len(class_indexes) == 0:
-            class_indexes = self.fill_empty_predictions(first_frame, last_frame, frame_number)
+            print("Candidate unlikely to be correct. Searching the next bracket.")
+            retries += 1
+            steps = 0
+            rejected.update(bracket for bracket in self.find_brackets(observations)
+                            if abs(bracket[0] - open_frame) <= self.confidence_margin)
 
-        print("Classes detected = {}".format(class_indexes))
+        print("Max. steps reached. Returning most likely sync point")
+        return self.likeliest_syncpoint(observations, first_frame, last_frame)
 
-        if np.mean(class_indexes) == 1.:  # step forth when all three frames are open
-            new_step_size = np.ceil(step_size / 2)
-            new_frame_number = frame_number + new_step_size
+    @staticmethod
+    def likeliest_syncpoint(observations: Dict[int, Tuple[int, float]], first_frame: int, last_frame: int) -> int:
+        """Picks the open frame of the most confident open -> closed bracket among the observations.
 
-            return self.syncpoint_binary_search(first_frame, last_frame, new_frame_number,
-                                                new_step_size, original_step_size, max_steps, max_retries)
+        Used when the bracket search gives up without a verified candidate. Observations without any bracket
+        (the slate never changes its class) yield their last open frame, or the first frame if none is open.
+        Padded observations may lie outside of the group, the result is kept within its borders.
 
-        elif np.mean(class_indexes) == 0.:  # step back when all three frames are closed
-            new_step_size = np.ceil(step_size / 2)
-            new_frame_number = frame_number - new_step_size
+        Args:
+            observations: The map of observations {frame_number: (class_index, confidence)}.
+            first_frame: Index of the first frame of the group.
+            last_frame: Index of the last frame of the group.
 
-            return self.syncpoint_binary_search(first_frame, last_frame, new_frame_number,
-                                                new_step_size, original_step_size, max_steps, max_retries)
+        Returns:
+            The likeliest sync point (index of the last open frame).
+        """
 
+        brackets = SyncpointDetector.find_brackets(observations)
+        if len(brackets) > 0:
+            syncpoint, _ = max(brackets, key=lambda bracket: (
+                observations[bracket[0]][1] + observations[bracket[1]][1], bracket[0] - bracket[1]))
         else:
-            padded_indexes = self.pad_final_prediction(frame_number=frame_number)
-            syncpoint = self.improved_syncpoint_detection(padded_indexes[:, 0],
-                                                          padded_indexes[:, 1],
-                                                          padded_indexes[:, 2])
+            open_frames = [frame for frame, (class_index, _) in observations.items()
+                           if class_index == CLASS_INDEX_DICT['open']]
+            syncpoint = max(open_frames) if len(open_frames) > 0 else first_frame
 
-            if syncpoint != None:
-                return syncpoint
-            else:
-                if max_retries == 0:
-                    print("Max. retries reached. Returning most likely sync point")
-                    return self.return_syncpoint_on_timeout(frame_number, np.array(class_indexes))
+        return min(max(syncpoint, first_frame), last_frame)
 
-                print("Candidate unlikely to be correct. Restarting search from random frame.")
-                new_frame_number = np.random.randint(first_frame, last_frame)
-                return self.syncpoint_binary_search(first_frame, last_frame, new_frame_number, original_step_size,
-                                               original_step_size, max_steps, max_retries - 1)
+    def observe(self, frame_number: int, open_frame: int, closed_frame: int,
+                observations: Dict[int, Tuple[int, float]]):
+        """Infers a single frame and adds its state to the observations.
 
-    def make_predictions(self, frame_number: int) -> Tuple[Dict[str, Union[int, np.ndarray]],
-                                                           Dict[str, Union[int, np.ndarray]],
-                                                           Dict[str, Union[int, np.ndarray]]]:
-        """Uses the machine learning model to predict the open/closed state of the slate in a frame and its neighbors.
+        A frame without any detected slate (or one that cannot be read) gets the state of the nearer border
+        of its bracket (see fill_empty_prediction).
 
         Args:
             frame_number: The frame in question.
-
-        Returns:
-            A tuple with predictions for the frame in question and its two direct neighbors.
+            open_frame: Index of the open frame the bracket starts with.
+            closed_frame: Index of the closed frame the bracket ends with.
+            observations: The map of observations {frame_number: (class_index, confidence)} to add to.
         """
 
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-        _, image = self.cap.read()
+        state = self.predict_frames([frame_number])[0]
+        has_slate, class_index, confidence = state if state is not None else (False, None, None)
+
+        if has_slate:
+            observations[frame_number] = (class_index, confidence)
+        else:
+            observations[frame_number] = (self.fill_empty_prediction(open_frame, closed_frame, frame_number), 0.)
+
+        print("Frame = {}, class = {}".format(frame_number, observations[frame_number][0]))
 
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number - 1)
-        _, prev_image = self.cap.read()
+    @staticmethod
+    def find_brackets(observations: Dict[int, Tuple[int, float]]) -> List[Tuple[int, int]]:
+        """Finds all neighbouring pairs of observations where an open frame is followed by a closed one.
 
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number + 1)
-        _, next_image = self.cap.read()
+        Args:
+            observations: The map of observations {frame_number: (class_index, confidence)}.
 
-        current_prediction = {'frame_number': frame_number, 'pred': np.array(self.model.predict(image))}
-        previous_prediction = {'frame_number': frame_number - 1, 'pred': np.array(self.model.predict(prev_image))}
-        next_prediction = {'frame_number': frame_number + 1, 'pred': np.array(self.model.predict(next_image))}
+        Returns:
+            A list of (open_frame, closed_frame) tuples.
+        """
 
-        return previous_prediction, current_prediction, next_prediction
+        frames = sorted(observations.keys())
+        return [(frame, next_frame) for frame, next_frame in zip(frames[:-1], frames[1:])
+                if observations[frame][0] == CLASS_INDEX_DICT['open']
+                and observations[next_frame][0] == CLASS_INDEX_DICT['closed']]
 
-    @staticmethod
-    def get_class_indexes(predictions: Tuple[Dict[str, Union[int, np.ndarray]], ...]) -> List:
-        """Given a tuple of predictions (coming from make_predictions), the predicted classes are extracted.
+    def predict_frames(self, frame_numbers: List[int]) -> List[Tuple[bool, int, float]]:
+        """Returns the slate states of the frames from param, infering only the ones not cached yet.
+
+        Uncached frames are read from the frame_source in one window (see FrameSource.read_frames)
+        and infered in one batch (see Yolo3Model.predict_state_batch).
+        Their states are cached. Frames the frame_source cannot read are left out of the batch.
 
         Args:
-            predictions: The predictions to extract the class indices from.
+            frame_numbers: The frames in question.
 
         Returns:
-            A list of the predicted class indices.
+            A list of (has_slate, class_index, confidence) tuples, in the order of frame_numbers.
+            None for each frame that could not be read.
         """
 
-        indices = list()
-        for pred in predictions:
-            if len(pred['pred']) > 0:
-                indices.append(int(pred['pred'][0][-1]))
-        return indices
+        states = dict()
+        uncached_frames = list()
+        for frame_number in frame_numbers:
+            state = self.prediction_cache.get(frame_number, self.model.model_id)
+            if state is None:
+                uncached_frames.append(frame_number)
+            else:
+                states[frame_number] = state
+
+        images = self.frame_source.read_frames(uncached_frames)
+        uncached_frames = [frame_number for frame_number in uncached_frames if images[frame_number] is not None]
+
+        for frame_number, state in zip(uncached_frames,
+                                       self.model.predict_state_batch([images[i] for i in uncached_frames])):
+            self.prediction_cache.put(frame_number, self.model.model_id, state)
+            states[frame_number] = state
 
-    def fill_empty_predictions(self, first_frame: int, last_frame: int, current_frame: int) -> List[int]:
-        """Depending on the position of the current_frame within the group boundaries, 3 class indices are returned.
+        return [states.get(frame_number) for frame_number in frame_numbers]
+
+    @staticmethod
+    def fill_empty_prediction(first_frame: int, last_frame: int, current_frame: int) -> int:
+        """Depending on the position of the current_frame within the bracket boundaries, a class index is returned.
 
         Args:
-            first_frame: Index of the first frame of the group.
-            last_frame: Index of the last frame of the group.
+            first_frame: Index of the first frame of the bracket.
+            last_frame: Index of the last frame of the bracket.
             current_frame: Index of the frame in question.
 
         Returns:
-            A list of three class indices, either all "open" or all "closed".
+            A class index, either "open" or "closed".
         """
 
-        open_idx = CLASS_INDEX_DICT['open']
-        closed_idx = CLASS_INDEX_DICT['closed']
-
         if abs(last_frame - current_frame) < abs(first_frame - current_frame):
-            return [closed_idx, closed_idx, closed_idx]
+            return CLASS_INDEX_DICT['closed']
         else:
-            return [open_idx, open_idx, open_idx]
+            return CLASS_INDEX_DICT['open']
 
     def pad_final_prediction(self, frame_number: int) -> np.ndarray:
         """(1 x confidence_margin) frames before and after the frame from param are infered again.
 
+        The window is clamped to the frames of the file, so near its first or last frame fewer frames are padded.
+
         Args:
             frame_number: The frame in question.
 
         Returns:
-            An array containing the predictions for the ((2 x confidence_margin) + 1) frames:
+            An array containing the predictions for the (at most (2 x confidence_margin) + 1) frames:
             np.ndarray[np.ndarray[frame_index, class_index, confidence], ...]
         """
 
         padded_prediction = list()
+        total_number_of_frames = int(self.frame_source.get(cv2.CAP_PROP_FRAME_COUNT))
+        frame_numbers = list(range(max(0, frame_number - self.confidence_margin),
+                                   min(frame_number + self.confidence_margin + 1, total_number_of_frames)))
 
-        # backward padding
-        j = frame_number - self.confidence_margin - 1
-        for i in range(self.confidence_margin):
-            current_frame = j + i + 1
-            print("Padding frame = {}".format(current_frame))
-            self.pad(current_frame, padded_prediction)
+        # backward and forward padding, infered as one batch
+        self.pad(frame_numbers, padded_prediction)
 
-        # forward padding
-        j = frame_number
-        for i in range(self.confidence_margin + 1):
-            current_frame = j + i
-            print("Padding frame = {}".format(current_frame))
-            self.pad(current_frame, padded_prediction)
-
-        return np.array(padded_prediction)
+        return np.reshape(np.array(padded_prediction), (-1, 3))
 
-    def pad(self, current_frame: int, padded_prediction: List):
-        """Inferes the current_frame and writes prediction into padded_prediction variable.
+    def pad(self, frame_numbers: List[int], padded_prediction: List):
+        """Inferes the frames from param in one batch and writes the predictions into padded_prediction variable.
 
         One prediction has the following form: np.ndarray[frame_index, class_index, confidence].
+        Frames without a detected slate keep the class and confidence of their best anchor, which is below the
+        confidence threshold of the model. Frames that cannot be read are left out.
 
         Args:
-            current_frame: The frame to infere.
-            padded_prediction: The list of predictions to add the current prediction to.
+            frame_numbers: The frames to infere.
+            padded_prediction: The list of predictions to add the current predictions to.
         """
 
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, current_frame)
-        _, image = self.cap.read()
-        prediction = self.model.predict(image)
-        class_idx = prediction[0][-1]
-        conf = prediction[0][-2]
-        padded_prediction.append(np.array([current_frame, class_idx, conf]))
+        for current_frame in frame_numbers:
+            print("Padding frame = {}".format(current_frame))
+
+        for current_frame, state in zip(frame_numbers, self.predict_frames(frame_numbers)):
+            if state is None:
+                continue
+            has_slate, class_idx, conf = state
+            padded_prediction.append(np.array([current_frame, class_idx, conf]))
 
     def improved_syncpoint_detection(self, frames: np.ndarray, predicted_states: np.ndarray,
                                      confidence_values: np.ndarray) -> int:
@@ -312,14 +380,3 @@ class SyncpointDetector:
                 syncpoints.append(i)
 
         return syncpoints
-
-    @staticmethod
-    def return_syncpoint_on_timeout(frame_number: int, class_indexes: np.ndarray) -> int:
-        """Extracts the first possible sync point within an array of predicted class indices. This is a last resort!
-
-        Args:
-            frame_number: The frame index the binary search is currently at.
-            class_indexes: An array of predicted class indices.
-        """
-        sync_index = np.where(class_indexes == 0)[0][0]
-        return frame_number - (sync_index - 1)
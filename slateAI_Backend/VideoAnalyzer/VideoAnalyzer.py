@@ -5,14 +5,30 @@ Contains functions for multi-threaded sync point searching inside a video file.
 import cv2
 import numpy as np
 import time
+import re
+import threading
+import subprocess
 import fleep
+import imageio_ffmpeg
 from videoprops import get_video_properties
 from VideoAnalyzer.SearchThread import SearchThread
+from VideoAnalyzer.SearchProcess import SearchProcessPool
+from VideoAnalyzer.PredictionCache import PredictionCache
+from VideoAnalyzer.FrameSource import FrameSource
+from VideoAnalyzer.ScaledFrameReader import ScaledFrameReader
 from VideoAnalyzer.SyncpointDetector import SyncpointDetector
 from VideoAnalyzer.Yolo3Model import Yolo3Model
+from VideoAnalyzer.SlateClassifier import SlateClassifier
 from LogManager import LogManager
 from PlaidMLManager import PlaidMLManager
-from typing import List, Tuple, Dict
+from typing import Any, Callable, List, Tuple, Dict, Iterator, Optional
+
+# Codecs that store every frame as a keyframe. Seeking in them never decodes more than the requested frame.
+INTRA_ONLY_CODECS = {'prores', 'dnxhd', 'mjpeg', 'rawvideo', 'v210', 'jpeg2000', 'cfhd', 'huffyuv'}
+
+# The cached state (has_slate, class_index, confidence) of frames rejected by the slate_classifier.
+REJECTED_STATE = (False, -1, 0.)
+
 
 class VideoAnalyzer:
     """Analyzes one single video file to find clap sync points.
@@ -21,83 +37,288 @@ class VideoAnalyzer:
     and uses the SyncPointDetector to find exact timestamps where the slate is being closed.
 
     Attributes:
-        cap: An OpenCV VideoCapture object for the file.
+        frame_source: The FrameSource of the file, used for the video properties and by the SyncpointDetector.
         fps: The temporal resolution (frames per second) of the video file.
         resolution: The spacial resoluton [width, height] of the video file.
         frame_count: The total amount of frames in the video file.
         duration: The duration of the video in seconds.
-        model: The machine learning model used for inference.
+        model: The machine learning model used for inference, by the SyncpointDetector.
+        scan_model: The machine learning model used by the slate search, e.g. a smaller input profile of model.
+        slate_classifier: The SlateClassifier rejecting frames without slates before the scan_model or None.
+        static_threshold: Sampled frames whose signature differs less from the last infered one reuse its state.
+            None infers every sampled frame (see jump_search).
+        search_stats: Amount of sampled frames the slate_classifier passed on to the scan_model and rejected
+            and amount of static frames that reused the state of a previous one.
+        stats_lock: The lock guarding search_stats, which all search threads count into.
         sample_rate: The step size while looking for slates in frames. Every (sample_rate)th will be analyzed.
+        coarse_sample_rate: The step size of the first, coarse search pass. A multiple of sample_rate.
         confidence_threshold: Minimal confidence needed to categorize an image as having a slate in it.
         margin: ??? -> Not in need right now.
         video_path: Path of the video file in need of analysis.
         logger: The LogManager to use for logging the analyzed file.
         plaidml_manager = The common PlaidMLManager object.
         start_time = Timestamp of the initialization process / start of analysis.
+        gop_size: The (estimated) distance between two keyframes in frames. None if scan_mode was not 'auto'.
+        scan_mode: How frames are read during the jump search: 'seek' or 'sequential'.
+        decode_mode: 'capture' decodes sequential scans with OpenCV at full resolution,
+            'scaled' with ffmpeg directly at model resolution (see ScaledFrameReader).
+        hwaccel: The ffmpeg hardware decoding method for the 'scaled' decode_mode or None.
+        prediction_cache: The PredictionCache shared by the jump search and the SyncpointDetector.
+            States are cached per model_id, so with a scan_model of another input size the SyncpointDetector
+            does not reuse the states of the search and infers the frames it needs again.
+        progress_callback: Called with intermediate results while the analysis is running (see analyze_video).
+        prior_seconds: Length of the head and tail regions searched for slates first. None searches the whole file.
+        scanned_regions: The regions [(start, end), ...] the last slate search went through.
         syncpoint_detector: The SyncpointDetector object used to find sync points in found slate frames.
     """
 
-    def __init__(self, video_path: str, model: Yolo3Model, sample_rate: int, confidence_threshold: float,
-                 logger: LogManager, plaidml_manager: PlaidMLManager, margin: int = 7):
+    def __init__(self, video_path: str, model: Yolo3Model, sample_rate: Optional[int], confidence_threshold: float,
+                 logger: LogManager, plaidml_manager: PlaidMLManager, margin: int = 7, scan_mode: str = 'auto',
+                 progress_callback: Callable[[str, Any], None] = None, prior_seconds: float = None,
+                 sample_seconds: float = 1.0, coarse_seconds: float = None,
+                 frame_buffer_bytes: int = 256 * 1024 * 1024, decode_mode: str = 'capture', hwaccel: str = None,
+                 scan_model: Yolo3Model = None, slate_classifier: SlateClassifier = None,
+                 static_threshold: float = None):
         """Initializes the VideoAnalyzer for a specific video file and all of the class attributes.
 
         Args:
             video_path: Path of the video file in need of analysis.
             model: The machine learning model used for inference.
             sample_rate: The step size while looking for slates in frames. Every (sample_rate)th will be analyzed.
+                None derives it from the fps of the file and sample_seconds.
             confidence_threshold: Minimal confidence needed to categorize an image as having a slate in it.
             logger: The LogManager to use for logging the analyzed file.
             plaidml_manager = The common PlaidMLManager object.
             margin: ??? -> Not in need right now.
+            scan_mode: Optional; 'seek' sets the capture position for every sample, 'sequential' decodes the
+                chunk once from start to end. 'auto' picks one of both depending on sample_rate and GOP length.
+            progress_callback: Optional; Called as progress_callback(event, data) with intermediate results:
+                ('slateGroups', [[start_seconds, end_seconds], ...]) once the slate search is done and
+                ('syncpoint', seconds) for every sync point, as soon as it is found.
+            prior_seconds: Optional; Slates are almost always in the first or last seconds of a take.
+                If given, only the first and last prior_seconds are searched first and the middle of the file
+                only if no slate was found there. None searches the whole file at once.
+            sample_seconds: Optional; The time between two analyzed frames if sample_rate is None.
+            coarse_seconds: Optional; The time between two analyzed frames in the coarse search pass.
+                Only the surroundings of its hits are searched with sample_rate afterwards (see search).
+                None searches with sample_rate right away.
+            frame_buffer_bytes: Optional; The memory cap of the ring buffer of decoded frames (see FrameSource).
+            decode_mode: Optional; 'scaled' lets ffmpeg decode sequential scans downscaled to the model input size,
+                instead of decoding full resolution frames with OpenCV ('capture'). Seek scans always use OpenCV.
+            hwaccel: Optional; The ffmpeg hardware decoding method (e.g. 'auto') for the 'scaled' decode_mode.
+            scan_model: Optional; The model used to search for slates (see Yolo3Model.profile), model only has to
+                tell open from closed slates in the SyncpointDetector afterwards. None searches with model.
+                Both stages only reuse cached states of their own model (see Yolo3Model.profile).
+            slate_classifier: Optional; A SlateClassifier. If given, the scan_model only infers the sampled frames
+                it does not reject.
+            static_threshold: Optional; The largest change of a frame signature (gray levels, see frame_signature)
+                up to which a sampled frame counts as unchanged and reuses the state of the last infered frame.
+                None infers every sampled frame.
         """
 
-        self.cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
-        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
-        self.resolution = [self.cap.get(cv2.CAP_PROP_FRAME_WIDTH), self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)]
-        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.frame_source = FrameSource(video_path, max_bytes=frame_buffer_bytes)
+        self.fps = self.frame_source.get(cv2.CAP_PROP_FPS)
+        self.resolution = [self.frame_source.get(cv2.CAP_PROP_FRAME_WIDTH),
+                           self.frame_source.get(cv2.CAP_PROP_FRAME_HEIGHT)]
+        self.frame_count = int(self.frame_source.get(cv2.CAP_PROP_FRAME_COUNT))
         self.duration = self.frame_count / self.fps
         self.model = model
-        self.sample_rate = sample_rate
+        self.scan_model = scan_model or model
+        self.slate_classifier = slate_classifier
+        self.static_threshold = static_threshold
+        self.search_stats = {"classifier passed": 0, "classifier rejected": 0, "static skipped": 0}
+        self.stats_lock = threading.Lock()
+        self.sample_rate = sample_rate or self.seconds_to_frames(sample_seconds)
+        self.coarse_sample_rate = self.sample_rate
+        if coarse_seconds:
+            self.coarse_sample_rate *= max(1, int(round(self.seconds_to_frames(coarse_seconds) / self.sample_rate)))
         self.confidence_threshold = confidence_threshold
         self.margin = margin
         self.video_path = video_path
         self.logger = logger
         self.plaidml_manager = plaidml_manager
         self.start_time = time.time()
+        self.gop_size = self.estimate_gop_size() if scan_mode == 'auto' else None
+        self.scan_mode = self.choose_scan_mode(scan_mode)
+        self.frame_source.max_grab_gap = max(1, self.gop_size // 2) if self.gop_size else 16
+        self.decode_mode = decode_mode
+        self.hwaccel = hwaccel
+        self.prediction_cache = PredictionCache(video_path)
+        self.progress_callback = progress_callback
+        self.prior_seconds = prior_seconds
+        self.scanned_regions = list()
         self.syncpoint_detector = SyncpointDetector(confidence_margin=4, confidence_threshold=confidence_threshold,
-                                                    model=model, cap=self.cap, sample_rate=sample_rate)
+                                                    model=model, frame_source=self.frame_source,
+                                                    sample_rate=self.sample_rate,
+                                                    prediction_cache=self.prediction_cache)
 
-    def analyze_video(self, workers: int, max_steps: int,
-                      max_retries: int) -> Tuple[List[float], int, int, List[int], float]:
+    def analyze_video(self, workers: int, max_steps: int, max_retries: int,
+                      search_pool: SearchProcessPool = None) -> Tuple[List[float], int, int, List[int], float]:
         """Performs video analysis, looking for slate sync points.
 
         Creates threads for searching frames with slates inside the video file, creating "slate groups" of
-        consecutive slate containing frames. It then uses the SyncPointDetector to find exact timestamps
+        consecutive slate containing frames. With prior_seconds the head and tail of the file are searched first
+        and the middle only if they contain no slate (see search_regions). Each region is searched coarse to fine
+        (see search). It then uses the SyncPointDetector to find exact timestamps
         where the slate is being closed within the groups. Results are logged.
+        Found groups and sync points are reported through the progress_callback while the analysis is running.
 
         Args:
             workers: Amount of threads to use for slate searching.
-            max_steps: Maximal amount of recursive steps the SyncPointDetector will make while searching in a group.
+            max_steps: Maximal amount of bisection steps per search attempt of the SyncPointDetector in a group.
             max_retries: Maximal amount of times a slate group will be searched for sync points by SyncPointDetector.
+            search_pool: Optional; A SearchProcessPool. If given, slates are searched in its worker processes
+                instead of threads and workers is ignored.
 
         Returns:
             A list of sync points, the FPS of the video file, the sample_rate / group padding used by the
             SyncPointDetector, the spacial resolution of the video and the duration of the video.
         """
 
-        preds, workers_objects = self.multi_threaded_search(workers)
+        preds = dict()
+        for regions in self.search_regions():
+            self.scanned_regions += regions
+            preds = self.search(workers, regions, search_pool)
+
+            if len(preds) > 0:
+                break
+            print("No slates in {}. Searching further.".format(regions))
+
         slate_frames = np.array(sorted(list(preds.keys())))
         groups = self.group_slate_frames(slate_frames)
+        self.report_progress('slateGroups', [[group[0] / self.fps, group[-1] / self.fps] for group in groups])
 
-        syncpoints_as_frames = self.syncpoint_detector.find_all_syncpoints_binary(groups=groups,
-                                                                                  max_steps=max_steps,
-                                                                                  max_retries=max_retries)
+        syncpoints_as_frames = self.syncpoint_detector.find_all_syncpoints_binary(
+            groups=groups, max_steps=max_steps, max_retries=max_retries,
+            on_syncpoint=lambda framenumber: self.report_progress('syncpoint', framenumber / self.fps))
         syncpoints_as_seconds = [framenumber/self.fps for framenumber in syncpoints_as_frames]
 
         self.log(syncpoints_as_seconds, time.time()-self.start_time)
         return syncpoints_as_seconds, self.fps, self.sample_rate, self.resolution, self.duration
 
-    def multi_threaded_search(self, workers: int) -> Tuple[Dict[int, float], List[SearchThread]]:
+    def report_progress(self, event: str, data: Any):
+        """Passes an intermediate result on to the progress_callback, if there is one.
+
+        Args:
+            event: The kind of result: 'slateGroups' or 'syncpoint'.
+            data: The result itself.
+        """
+
+        if self.progress_callback is not None:
+            self.progress_callback(event, data)
+
+    def search(self, workers: int, regions: List[Tuple[int, int]],
+               search_pool: SearchProcessPool = None) -> Dict[int, float]:
+        """Searches regions of the video file for slates, first coarse and then fine around the hits.
+
+        The coarse pass analyzes every (coarse_sample_rate)th frame. Around each hit, every (sample_rate)th frame
+        up to the neighbouring coarse samples is analyzed afterwards, which finds the borders of the slate groups
+        with the same precision as a full search with sample_rate (see densify_regions):
+        ###################################################################################################
+        ##   miss            |               hit               |               miss           |     ...  ##
+        ##        |     |    |    |     |     |     |     |    |                              |     ...  ##
+        ###################################################################################################
+                  |___________ densified _____________________|
+
+        Args:
+            workers: Amount of threads to use, ignored if a search_pool is given.
+            regions: The (start, end) frame number tuples to search.
+            search_pool: Optional; A SearchProcessPool to search in instead of threads.
+
+        Returns:
+            A dict with predictions {frame_number: confidence, ...} of the frames with slates.
+        """
+
+        preds = self.search_stride(workers, regions, self.coarse_sample_rate, search_pool)
+
+        if len(preds) > 0 and self.coarse_sample_rate > self.sample_rate:
+            windows = self.densify_regions(sorted(preds.keys()), regions)
+            print("Densifying {} coarse hits in {} windows".format(len(preds), len(windows)))
+            preds.update(self.search_stride(workers, windows, self.sample_rate, search_pool))
+
+        return preds
+
+    def search_stride(self, workers: int, regions: List[Tuple[int, int]], stride: int,
+                      search_pool: SearchProcessPool = None) -> Dict[int, float]:
+        """Searches regions of the video file for slates with a fixed step size, in threads or processes.
+
+        Args:
+            workers: Amount of threads to use, ignored if a search_pool is given.
+            regions: The (start, end) frame number tuples to search.
+            stride: Every (stride)th frame of each region is analyzed.
+            search_pool: Optional; A SearchProcessPool to search in instead of threads.
+
+        Returns:
+            A dict with predictions {frame_number: confidence, ...} of the frames with slates.
+        """
+
+        if search_pool is not None:
+            return self.multi_process_search(search_pool, regions, stride)
+
+        preds, workers_objects = self.multi_threaded_search(workers, regions, stride)
+        return preds
+
+    def densify_regions(self, hits: List[int], regions: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """Builds the windows between the coarse samples next to each coarse hit.
+
+        The windows start on the sample_rate grid of their region, so the coarse hits are part of it.
+        Overlapping windows of neighbouring hits are merged.
+
+        Args:
+            hits: Sorted frame numbers of the coarse samples containing slates.
+            regions: The (start, end) frame number tuples the coarse pass searched.
+
+        Returns:
+            A list of (start, end) frame number tuples.
+        """
+
+        reach = self.coarse_sample_rate - self.sample_rate
+        windows = list()
+        for hit in hits:
+            region_start, region_end = next((start, end) for start, end in regions if start <= hit < end)
+            start, end = max(region_start, hit - reach), min(region_end, hit + reach + 1)
+
+            if len(windows) > 0 and windows[-1][1] >= start and windows[-1][0] >= region_start:
+                windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+            else:
+                windows.append((start, end))
+        return windows
+
+    def seconds_to_frames(self, seconds: float) -> int:
+        """Converts a duration into an amount of frames of the video file (at least 1).
+
+        Args:
+            seconds: The duration in seconds.
+
+        Returns:
+            The amount of frames.
+        """
+
+        return max(1, int(round(seconds * self.fps)))
+
+    def search_regions(self) -> List[List[Tuple[int, int]]]:
+        """Divides the video file into the regions to search for slates one after the other.
+
+        Without prior_seconds (or for files shorter than twice of it) the whole file is one region.
+        Otherwise the head and the tail of the file are searched first and the middle afterwards:
+        ###################################################################################################
+        ##   head (prior_seconds)   #                     middle                    #   tail (prior_s.)  ##
+        ###################################################################################################
+        |____________pass 1_________|___________________pass 2______________________|______pass 1_______|
+
+        Returns:
+            A list of passes, each being a list of (start, end) frame number tuples.
+        """
+
+        border = int(self.prior_seconds * self.fps) if self.prior_seconds else 0
+        if border <= 0 or 2 * border >= self.frame_count:
+            return [[(0, self.frame_count)]]
+
+        return [[(0, border), (self.frame_count - border, self.frame_count)],
+                [(border, self.frame_count - border)]]
+
+    def multi_threaded_search(self, workers: int, regions: List[Tuple[int, int]] = None,
+                              stride: int = None) -> Tuple[Dict[int, float], List[SearchThread]]:
         """Starts multiple threads/workers to search for slates inside frames.
 
         Divides the video file into chunks of consecutive frames and assigns each chunk to a separate Thread.
@@ -116,6 +337,9 @@ class VideoAnalyzer:
 
         Args:
             workers: Amount of chunks and threads/workers.
+            regions: Optional; The (start, end) frame number tuples to search, shared out among the workers.
+                Defaults to the whole file.
+            stride: Optional; Every (stride)th frame is analyzed. Defaults to sample_rate.
 
         Returns:
             A dict with predictions {frame_number: confidence, ...},
@@ -125,17 +349,15 @@ class VideoAnalyzer:
         preds = dict()
         worker_objects = list()
         steps_done = 0
+        chunks = self.split_regions(workers, regions, stride)
+        stride = stride or self.sample_rate
 
-        nb_steps = self.frame_count // self.sample_rate
+        nb_steps = sum(end - start for start, end in chunks) // stride
         print("Total number of steps = {}".format(nb_steps))
 
         # Create and start threads:
-        for i in range(workers):
-            lower_border = self.frame_count // workers * i
-            upper_border = self.frame_count if i == workers - 1 else self.frame_count // workers * (i + 1)
-            chunk = (lower_border, upper_border)
-
-            worker = SearchThread(i, chunk, preds, self, steps_done)
+        for i, chunk in enumerate(chunks):
+            worker = SearchThread(i, chunk, preds, self, steps_done, stride)
             worker_objects.append(worker)
             worker.start()
 
@@ -145,7 +367,169 @@ class VideoAnalyzer:
 
         return preds, worker_objects
 
-    def jump_search(self, chunk: Tuple[int, int], thread_id: int, predictions: Dict[int, float], steps_done: int):
+    def multi_process_search(self, search_pool: SearchProcessPool, regions: List[Tuple[int, int]] = None,
+                             stride: int = None) -> Dict[int, float]:
+        """Searches for slates inside frames using the worker processes of a SearchProcessPool.
+
+        The video file is divided into one chunk per worker process, exactly like in multi_threaded_search.
+        Each process decodes and infers its chunk with its own copy of the model, outside of the GIL.
+        The predictions of all sampled frames are copied into the prediction_cache afterwards.
+        The workers use the SlateClassifier of the search_pool (if any) instead of slate_classifier.
+
+        Args:
+            search_pool: The pool of worker processes to use.
+            regions: Optional; The (start, end) frame number tuples to search. Defaults to the whole file.
+            stride: Optional; Every (stride)th frame is analyzed. Defaults to sample_rate.
+
+        Returns:
+            A dict with predictions {frame_number: confidence, ...}.
+        """
+
+        chunks = self.split_regions(search_pool.workers, regions, stride)
+        stride = stride or self.sample_rate
+        print("Total number of steps = {}".format(sum(end - start for start, end in chunks) // stride))
+
+        preds, sampled_predictions, search_stats = search_pool.search(
+            self.video_path, chunks, stride, self.confidence_threshold, self.scan_mode,
+            self.decode_mode, self.hwaccel, self.scan_model.input_size, self.static_threshold)
+        for frame_number, prediction in sampled_predictions.items():
+            self.prediction_cache.put(frame_number, self.scan_model.model_id, prediction)
+        with self.stats_lock:
+            for key in self.search_stats:
+                self.search_stats[key] += search_stats[key]
+
+        return preds
+
+    def split_regions(self, workers: int, regions: List[Tuple[int, int]] = None,
+                      stride: int = None) -> List[Tuple[int, int]]:
+        """Shares the workers out among regions of the video file and divides each region into chunks.
+
+        Args:
+            workers: Amount of workers. Every region gets at least one.
+            regions: Optional; The (start, end) frame number tuples to divide. Defaults to the whole file.
+            stride: Optional; The step size the chunks are searched with (see split_into_chunks).
+
+        Returns:
+            A list of tuples containing the start and end frame numbers of each chunk.
+        """
+
+        if regions is None:
+            regions = [(0, self.frame_count)]
+
+        chunks = list()
+        for region in regions:
+            chunks += self.split_into_chunks(max(1, workers // len(regions)), region, stride)
+        return chunks
+
+    def split_into_chunks(self, workers: int, region: Tuple[int, int] = None,
+                          stride: int = None) -> List[Tuple[int, int]]:
+        """Divides the video file (or a region of it) into chunks of consecutive frames, one for each worker.
+
+        The chunk borders are multiples of stride away from the start of the region, so the chunks together
+        sample the same frames as a single jump search over the region would.
+
+        Args:
+            workers: Amount of chunks.
+            region: Optional; A tuple of the start and end frame numbers to divide. Defaults to the whole file.
+            stride: Optional; The step size the chunks are searched with. Defaults to sample_rate.
+
+        Returns:
+            A list of tuples containing the start and end frame numbers of each chunk.
+        """
+
+        start, end = region if region is not None else (0, self.frame_count)
+        stride = stride or self.sample_rate
+        steps = -(-(end - start) // stride)  # amount of sampled frames, rounded up
+
+        chunks = list()
+        for i in range(workers):
+            lower_border = start + steps // workers * i * stride
+            upper_border = end if i == workers - 1 else start + steps // workers * (i + 1) * stride
+            if upper_border > lower_border:
+                chunks.append((lower_border, upper_border))
+        return chunks
+
+    def estimate_gop_size(self, probe_seconds: int = 20) -> int:
+        """Estimates the GOP length (distance between two keyframes in frames) of the video file.
+
+        Intra-only codecs are recognized by name. For all other codecs ffmpeg decodes only the keyframes
+        of the first probe_seconds of the file and the median distance between their timestamps is used.
+
+        Args:
+            probe_seconds: Optional; Amount of seconds at the start of the file to look for keyframes in.
+
+        Returns:
+            The estimated GOP length in frames. 1 for intra-only video.
+        """
+
+        try:
+            if get_video_properties(self.video_path)['codec_name'] in INTRA_ONLY_CODECS:
+                return 1
+        except Exception:
+            pass
+
+        command = [imageio_ffmpeg.get_ffmpeg_exe(), '-hide_banner', '-nostats',
+                   '-skip_frame', 'nokey', '-t', str(probe_seconds), '-i', self.video_path,
+                   '-an', '-vf', 'showinfo', '-f', 'null', '-']
+        try:
+            output = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE).stderr
+        except OSError:
+            return int(self.fps) if self.fps > 0 else 1
+        keyframe_times = [float(t) for t in re.findall(r'pts_time:\s*(-?[0-9.]+)', output.decode(errors='ignore'))]
+
+        if len(keyframe_times) < 2:  # at most one keyframe within the probed range
+            return max(1, int(probe_seconds * self.fps))
+
+        return max(1, int(round(np.median(np.diff(keyframe_times)) * self.fps)))
+
+    def choose_scan_mode(self, scan_mode: str) -> str:
+        """Resolves the scan mode used by jump_search.
+
+        Setting the capture position makes the decoder start at the previous keyframe, on average
+        gop_size / 2 frames in front of the sample, plus the cost of flushing the decoder.
+        Reading sequentially decodes sample_rate frames per sample instead, but converts only the sampled ones.
+        Sequential reading therefore wins as soon as the step size of the (coarse) search pass
+        does not exceed the GOP length.
+
+        Args:
+            scan_mode: 'seek', 'sequential' or 'auto'.
+
+        Returns:
+            Either 'seek' or 'sequential'.
+        """
+
+        if scan_mode != 'auto':
+            return scan_mode
+
+        if self.gop_size > 1 and self.coarse_sample_rate <= self.gop_size:
+            return 'sequential'
+        return 'seek'
+
+    def read_frames(self, frame_source: FrameSource, chunk: Tuple[int, int],
+                    stride: int) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yields every (stride)th frame of the chunk.
+
+        Whether the frame_source seeks to each of them or decodes the chunk once from start to end
+        depends on its max_grab_gap (see jump_search). Frames in between samples are skipped with grab(),
+        so they are never converted to images.
+
+        Args:
+            frame_source: The FrameSource to read from.
+            chunk: A tuple containing the start and end frame numbers of the chunk to be read.
+            stride: The step size between the yielded frames.
+
+        Yields:
+            Tuples of (frame_number, image).
+        """
+
+        for frame_number in range(chunk[0], chunk[1], stride):
+            image = frame_source.read(frame_number)
+
+            if image is not None:
+                yield frame_number, image
+
+    def jump_search(self, chunk: Tuple[int, int], thread_id: int, predictions: Dict[int, float], steps_done: int,
+                    stride: int = None):
         """Performs jump search using the sample_rate within a specified chunk of the video file.
 
         Visual example: chunk = (0, 15). With a sample_rate of 4, every fourth frame of the chunk
@@ -162,6 +546,16 @@ class VideoAnalyzer:
         |____________________________________________________________________________________________________________...
                                                                 file ->
 
+        Depending on the scan_mode the sampled frames are either read by seeking to each of them
+        or by decoding the chunk once sequentially (see read_frames). Each call uses a FrameSource of its own
+        without buffer, because sampled frames are never read twice (their predictions are cached).
+        With the 'scaled' decode_mode sequential scans are decoded by ffmpeg at model resolution instead
+        and no FrameSource is opened.
+        Sampled frames are collected and infered by the scan_model in batches of its batch_size frames.
+        With a static_threshold, a sampled frame whose signature (see frame_signature) differs at most
+        static_threshold from the one of the last infered frame (locked-off camera, rolling before "action")
+        is not infered but gets the state of that frame, once it is known (see reuse_states).
+
         The results of the model predictions are saved into the predictions dict (shared by all workers/threads)
         so that they can be accessed by the thread running the function and the multi_threaded_search function
         that started the threads in the first place.
@@ -172,25 +566,145 @@ class VideoAnalyzer:
             predictions: A dict containing the predicted confidences for each analyzed frame:
                 {frame_number: confidence, ...}
             steps_done: Amount of frames analyzed. Starts at 0, ends at video_analyzer.sample_rate.
+            stride: Optional; The step size used instead of sample_rate (e.g. by the coarse search pass).
         """
 
-        cap = cv2.VideoCapture(self.video_path)
         j = 0
-
-        for i in range(chunk[0], chunk[1], self.sample_rate):
+        stride = stride or self.sample_rate
+        frame_source = None
+
+        scaled = self.scan_mode == 'sequential' and self.decode_mode == 'scaled'
+        if scaled:
+            reader = ScaledFrameReader(self.video_path, self.fps, self.resolution, self.scan_model.input_size,
+                                       hwaccel=self.hwaccel, buffer_count=self.scan_model.batch_size)
+            frames = reader.read(chunk, stride)
+        else:
+            frame_source = FrameSource(self.video_path, max_bytes=0,
+                                       max_grab_gap=stride if self.scan_mode == 'sequential' else 0)
+            frames = self.read_frames(frame_source, chunk, stride)
+
+        batch = list()
+        # static frames waiting for the state of their reference [(frame_number, reference_frame_number), ...]
+        static_frames = list()
+        # (frame_number, signature) of the last frame sent to the model
+        reference = None
+        states = dict()
+
+        for i, img in frames:
             steps_done += 1
             if j % 100 == 0:
                 print("Thread {} - frame {}/{}".format(thread_id, i, chunk[1]))
                 print("Steps done = {}".format(steps_done))
+            j += stride
+
+            if self.static_threshold is not None:
+                signature = self.frame_signature(img)
+                if reference is not None and np.max(np.abs(signature - reference[1])) <= self.static_threshold:
+                    static_frames.append((i, reference[0]))
+                    continue
+                reference = (i, signature)
+                # the buffers of the ScaledFrameReader are overwritten while skipped frames are read
+                img = img.copy() if scaled else img
+
+            batch.append((i, img))
+
+            if len(batch) == self.scan_model.batch_size:
+                states.update(self.predict_batch(batch, predictions))
+                self.reuse_states(static_frames, states, predictions)
+                batch, static_frames = list(), list()
+
+        states.update(self.predict_batch(batch, predictions))
+        self.reuse_states(static_frames, states, predictions)
+        if frame_source is not None:
+            frame_source.release()
+
+    @staticmethod
+    def frame_signature(image: np.ndarray) -> np.ndarray:
+        """Returns a 64 x 36 gray thumbnail of a frame, its cells are averages over large blocks of pixels.
+
+        Noise and compression artifacts average out in the cells, while a slate entering even a small part of
+        the picture changes some of them a lot. Frames are compared by the largest difference of any cell.
+
+        Args:
+            image: The frame (BGR).
+
+        Returns:
+            The thumbnail (float32).
+        """
+
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, (64, 36), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def reuse_states(self, static_frames: List[Tuple[int, int]], states: Dict[int, Tuple[bool, int, float]],
+                     predictions: Dict[int, float]):
+        """Gives static frames the state of their reference frame, as if they had been infered.
+
+        Their states stay local to the scan and are not put into the prediction_cache, so the
+        SyncpointDetector still infers these frames if it needs them.
+
+        Args:
+            static_frames: The static frames [(frame_number, reference_frame_number), ...].
+                All reference frames have to be infered already.
+            states: The states of the infered frames {frame_number: (has_slate, class_index, confidence), ...}.
+            predictions: A dict containing the predicted confidences for each analyzed frame:
+                {frame_number: confidence, ...}
+        """
 
-            cap.set(cv2.CAP_PROP_POS_FRAMES, i)
-            _, img = cap.read()
+        for i, reference in static_frames:
+            has_slate, class_index, confidence = states[reference]
+            if has_slate and confidence >= self.confidence_threshold:
+                predictions[i] = confidence
 
-            prediction = self.model.predict(img)
-            j += self.sample_rate
+        with self.stats_lock:
+            self.search_stats["static skipped"] += len(static_frames)
+
+    def predict_batch(self, batch: List[Tuple[int, np.ndarray]],
+                      predictions: Dict[int, float]) -> Dict[int, Tuple[bool, int, float]]:
+        """Infers a batch of sampled frames with one model call and saves the slate containing ones.
+
+        Frames already present in the prediction_cache are not infered again.
+        Only the slate state of each frame is infered (see Yolo3Model.predict_state_batch), so downscaled frames
+        (see ScaledFrameReader) need no information about the original resolution.
+        With a slate_classifier, frames it rejects are not infered by the scan_model but cached as REJECTED_STATE.
+
+        Args:
+            batch: A list of (frame_number, image) tuples.
+            predictions: A dict containing the predicted confidences for each analyzed frame:
+                {frame_number: confidence, ...}
+
+        Returns:
+            The states of the frames {frame_number: (has_slate, class_index, confidence), ...}.
+        """
 
-            if len(prediction) > 0 and prediction[0][4] >= self.confidence_threshold:
-                predictions[i] = prediction[0]
+        batch_states = dict()
+        uncached = list()
+        for i, img in batch:
+            state = self.prediction_cache.get(i, self.scan_model.model_id)
+            if state is None:
+                uncached.append((i, img))
+            else:
+                batch_states[i] = state
+
+        if self.slate_classifier is not None and len(uncached) > 0:
+            flags = self.slate_classifier.flag_batch([img for _, img in uncached])
+            for (i, _), flag in zip(uncached, flags):
+                if not flag:
+                    self.prediction_cache.put(i, self.scan_model.model_id, REJECTED_STATE)
+                    batch_states[i] = REJECTED_STATE
+            with self.stats_lock:
+                self.search_stats["classifier passed"] += int(np.sum(flags))
+                self.search_stats["classifier rejected"] += len(flags) - int(np.sum(flags))
+            uncached = [frame for frame, flag in zip(uncached, flags) if flag]
+
+        for (i, _), state in zip(uncached, self.scan_model.predict_state_batch([img for _, img in uncached])):
+            self.prediction_cache.put(i, self.scan_model.model_id, state)
+            batch_states[i] = state
+
+        for i, (has_slate, class_index, confidence) in batch_states.items():
+            if has_slate and confidence >= self.confidence_threshold:
+                predictions[i] = confidence
+
+        return batch_states
 
     def group_slate_frames(self, frames: List[int]) -> List[List[int]]:
         """A list of frames is grouped by temporal distance.
@@ -251,8 +765,17 @@ class VideoAnalyzer:
                    "average frametime": str(self.duration / self.fps),
                    "resolution": self.resolution,
                    "sample rate": self.sample_rate,
+                   "coarse sample rate": self.coarse_sample_rate,
+                   "scan mode": self.scan_mode,
+                   "decode mode": self.decode_mode,
+                   "scan input size": self.scan_model.input_size,
+                   "refine input size": self.model.input_size,
+                   "search stats": self.search_stats,
+                   "scanned frames": sum(end - start for start, end in self.scanned_regions),
                    "framework": "Tensorflow",
                    "device": str(self.plaidml_manager.standard_tf_device),
                    "inference_duration": inference_duration,
+                   "prediction cache": self.prediction_cache.stats(),
+                   "frame source": self.frame_source.stats(),
                    "results": syncpoints}
         self.logger.log(log_obj, "File Video")
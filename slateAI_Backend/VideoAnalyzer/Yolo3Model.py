@@ -1,62 +1,100 @@
+import os
+import copy
+import threading
 import tensorflow as tf
 import VideoAnalyzer.core.utils as utils
 import numpy as np
 
 class Yolo3Model:
-    def __init__(self, modelpath):
-        self.input_size = 544
+    def __init__(self, modelpath, session_config=None, input_size=544):
+        self.modelpath = modelpath
+        # the frozen graph has no fixed input shape, every multiple of 32 works (see profile)
+        assert input_size % 32 == 0, "input_size has to be a multiple of 32"
+        self.input_size = input_size
+        # identifies the predictions of this model in a PredictionCache
+        self.model_id = "{}@{}".format(os.path.basename(modelpath), self.input_size)
         self.num_classes = 2
         self.graph = tf.Graph()
         self.return_elements = ["input/input_data:0", "pred_sbbox/concat_2:0", "pred_mbbox/concat_2:0", "pred_lbbox/concat_2:0"]
         print(modelpath)
         self.return_tensors = utils.read_pb_return_tensors(self.graph, modelpath, self.return_elements)
-        self.sess  = tf.Session(graph=self.graph)
+        self.sess  = tf.Session(graph=self.graph, config=session_config)
         self.confidence_threshold = 0.85
-        
+        # frames per sess.run, trades per-call overhead against the memory of the decoded frames
+        self.batch_size = 4
+        # reusable float32 letterbox buffers (batch x input_size x input_size x 3), one per thread
+        self.buffers = threading.local()
+        # models of other input sizes sharing the graph and session of this one {input_size: Yolo3Model, ...}
+        self.profiles = {input_size: self}
 
 
+    def profile(self, input_size):
+        """Returns the model for another input size, sharing graph and session with this one.
+
+        Smaller input sizes trade accuracy for speed, the backbone cost grows with the square of the input size
+        (e.g. 320 for the slate search and 544 for the open/closed refinement, see config.MODEL_PROFILES).
+        Each profile has its own model_id, so its predictions are cached apart: the states the scan profile
+        cached are never used by the refine profile, which infers every frame it needs at its own size."""
+        if input_size not in self.profiles:
+            assert input_size % 32 == 0, "input_size has to be a multiple of 32"
+            model = copy.copy(self)
+            model.input_size = input_size
+            model.model_id = "{}@{}".format(os.path.basename(self.modelpath), input_size)
+            model.buffers = threading.local()
+            self.profiles[input_size] = model
+        return self.profiles[input_size]
+
+    def input_buffer(self, batch_size):
+        """Returns this thread's letterbox buffer for batch_size frames, growing it if needed."""
+        buffer = getattr(self.buffers, 'input_data', None)
+        if buffer is None or len(buffer) < batch_size:
+            buffer = np.empty((max(batch_size, self.batch_size), self.input_size, self.input_size, 3),
+                              dtype=np.float32)
+            self.buffers.input_data = buffer
+        return buffer[:batch_size]
+
     def predict(self, image):
-        # image preprocessing
-        org_image = np.copy(image)
-        org_h, org_w, _ = org_image.shape
-        image_data = utils.image_preporcess(np.copy(image), [self.input_size, self.input_size])
-        image_data = image_data[np.newaxis, ...]
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images):
+        """Runs one session call on a batch of frames and returns the filtered bboxes for each of them,
+        in the coordinates of each frame."""
+        if len(images) == 0:
+            return []
+        pred_bbox = self.run_batch(images)
+        org_img_shapes = [image.shape[:2] for image in images]
+        batch_bboxes = []
+        for bboxes in utils.postprocess_boxes_batch(pred_bbox, org_img_shapes, self.input_size,
+                                                    self.confidence_threshold):
+            #filter bboxes
+            batch_bboxes.append(utils.nms(bboxes, 0.45, method='nms'))
+
+        return batch_bboxes
+
+    def predict_state(self, image):
+        return self.predict_state_batch([image])[0]
+
+    def predict_state_batch(self, images):
+        """Runs one session call on a batch of frames and returns (has_slate, class_index, confidence) for each.
+
+        The state is read straight from the raw head outputs: the anchor with the highest score (objectness x
+        class probability) decides, without decoding, clipping or nms of any box. has_slate is True if its
+        score is above the confidence_threshold, class_index and confidence are those of that anchor anyway."""
+        if len(images) == 0:
+            return []
+        has_slate, classes, scores = utils.top_state_batch(self.run_batch(images), self.confidence_threshold)
+        return [(bool(h), int(c), float(s)) for h, c, s in zip(has_slate, classes, scores)]
+
+    def run_batch(self, images):
+        """Preprocesses the frames and runs the network, returns the raw outputs of all three heads
+        (batch, anchors of all three scales, 5 + num_classes)."""
+        # image preprocessing, written straight into the reusable batch buffer
+        image_data = self.input_buffer(len(images))
+        for i, image in enumerate(images):
+            utils.image_preporcess(image, [self.input_size, self.input_size], out=image_data[i])
         # run NN
         pred_sbbox, pred_mbbox, pred_lbbox = self.sess.run(
             [self.return_tensors[1], self.return_tensors[2], self.return_tensors[3]],
                     feed_dict={ self.return_tensors[0]: image_data})
-        # postprocessing
-        pred_bbox = np.concatenate([np.reshape(pred_sbbox, (-1, 5 + self.num_classes)),
-                                    np.reshape(pred_mbbox, (-1, 5 + self.num_classes)),
-                                    np.reshape(pred_lbbox, (-1, 5 + self.num_classes))], axis=0)
-        bboxes = utils.postprocess_boxes(pred_bbox, (org_h, org_w), self.input_size, self.confidence_threshold)
-        #filter bboxes
-        bboxes = utils.nms(bboxes, 0.45, method='nms')
-
-        return  bboxes
-
-        # use this to return a class only
-        """
-         #make to numpy array
-        bboxes = np.array(bboxes)
-        #keep indexes 4 und 5 of all rows (=prop & class)
-        bboxes = bboxes[:,4:6]
-        if more than 1 bbox, keep the one with highest prob
-        if len(bboxes) > 1:
-            # select rows where prob equals max of probs
-            bboxes = bboxes[bboxes[:,0] == np.amax(bboxes, axis=0)]
-            
-        if bboxes[0][1]==1.0:
-            return "open"
-        else:
-            return "closed"   
-        """
-
-
-        pred_bbox = np.concatenate([np.reshape(pred_sbbox, (-1, 5 + self.num_classes)),
-                                    np.reshape(pred_mbbox, (-1, 5 + self.num_classes)),
-                                    np.reshape(pred_lbbox, (-1, 5 + self.num_classes))], axis=0)
-        bboxes = utils.postprocess_boxes(pred_bbox, (org_h, org_w), self.input_size, self.score_threshold)
-        bboxes = utils.nms(bboxes, self.iou_threshold)
-
-        return bboxes
\ No newline at end of file
+        return np.concatenate([np.reshape(pred, (len(images), -1, 5 + self.num_classes))
+                               for pred in (pred_sbbox, pred_mbbox, pred_lbbox)], axis=1)
@@ -0,0 +1,165 @@
+"""Benchmarks the YOLOv3 post-processing of core/utils against its former loop-based implementation.
+
+Usage (from the slateAI_Backend directory):
+    python -m VideoAnalyzer.benchmark --frames 256 --threshold 0.85 0.3 --cluster 200 500
+
+The raw network outputs are synthetic: background anchors with low confidence and a cluster of overlapping,
+confident boxes around one slate per frame, like the frozen model produces for a slate in view.
+Both implementations run on the same outputs and their boxes are compared for equality.
+Each pair of --threshold and --cluster is one regime: the default model threshold with a typical cluster and a low
+threshold with a large cluster, where many boxes survive the score threshold and nms dominates.
+"""
+
+import argparse
+import time
+import numpy as np
+import VideoAnalyzer.core.utils as utils
+from typing import Callable, Tuple, Any
+
+
+def postprocess_boxes_loop(pred_bbox, org_img_shape, input_size, score_threshold):
+    """The former implementation of utils.postprocess_boxes (transforms all anchors before thresholding)."""
+
+    valid_scale = [0, np.inf]
+    pred_bbox = np.array(pred_bbox)
+
+    pred_xywh = pred_bbox[:, 0:4]
+    pred_conf = pred_bbox[:, 4]
+    pred_prob = pred_bbox[:, 5:]
+
+    pred_coor = np.concatenate([pred_xywh[:, :2] - pred_xywh[:, 2:] * 0.5,
+                                pred_xywh[:, :2] + pred_xywh[:, 2:] * 0.5], axis=-1)
+    org_h, org_w = org_img_shape
+    resize_ratio = min(input_size / org_w, input_size / org_h)
+
+    dw = (input_size - resize_ratio * org_w) / 2
+    dh = (input_size - resize_ratio * org_h) / 2
+
+    pred_coor[:, 0::2] = 1.0 * (pred_coor[:, 0::2] - dw) / resize_ratio
+    pred_coor[:, 1::2] = 1.0 * (pred_coor[:, 1::2] - dh) / resize_ratio
+
+    pred_coor = np.concatenate([np.maximum(pred_coor[:, :2], [0, 0]),
+                                np.minimum(pred_coor[:, 2:], [org_w - 1, org_h - 1])], axis=-1)
+    invalid_mask = np.logical_or((pred_coor[:, 0] > pred_coor[:, 2]), (pred_coor[:, 1] > pred_coor[:, 3]))
+    pred_coor[invalid_mask] = 0
+
+    bboxes_scale = np.sqrt(np.multiply.reduce(pred_coor[:, 2:4] - pred_coor[:, 0:2], axis=-1))
+    scale_mask = np.logical_and((valid_scale[0] < bboxes_scale), (bboxes_scale < valid_scale[1]))
+
+    classes = np.argmax(pred_prob, axis=-1)
+    scores = pred_conf * pred_prob[np.arange(len(pred_coor)), classes]
+    score_mask = scores > score_threshold
+    mask = np.logical_and(scale_mask, score_mask)
+    coors, scores, classes = pred_coor[mask], scores[mask], classes[mask]
+
+    return np.concatenate([coors, scores[:, np.newaxis], classes[:, np.newaxis]], axis=-1)
+
+
+def nms_loop(bboxes, iou_threshold):
+    """The former implementation of utils.nms (recomputes the IoU and rebuilds the array per kept box)."""
+
+    classes_in_img = list(set(bboxes[:, 5]))
+    best_bboxes = []
+
+    for cls in classes_in_img:
+        cls_mask = (bboxes[:, 5] == cls)
+        cls_bboxes = bboxes[cls_mask]
+
+        while len(cls_bboxes) > 0:
+            max_ind = np.argmax(cls_bboxes[:, 4])
+            best_bbox = cls_bboxes[max_ind]
+            best_bboxes.append(best_bbox)
+            cls_bboxes = np.concatenate([cls_bboxes[: max_ind], cls_bboxes[max_ind + 1:]])
+            iou = utils.bboxes_iou(best_bbox[np.newaxis, :4], cls_bboxes[:, :4])
+            weight = np.ones((len(iou),), dtype=np.float32)
+            weight[iou > iou_threshold] = 0.0
+            cls_bboxes[:, 4] = cls_bboxes[:, 4] * weight
+            cls_bboxes = cls_bboxes[cls_bboxes[:, 4] > 0.]
+
+    return best_bboxes
+
+
+def predict_loop(pred_bbox, org_img_shapes, input_size, score_threshold):
+    """The former post-processing of Yolo3Model.predict_batch (one frame after the other)."""
+
+    return [nms_loop(postprocess_boxes_loop(pred_bbox[i], org_img_shapes[i], input_size, score_threshold), 0.45)
+            for i in range(len(pred_bbox))]
+
+
+def predict_vectorized(pred_bbox, org_img_shapes, input_size, score_threshold):
+    """The current post-processing of Yolo3Model.predict_batch."""
+
+    return [utils.nms(bboxes, 0.45) for bboxes in
+            utils.postprocess_boxes_batch(pred_bbox, org_img_shapes, input_size, score_threshold)]
+
+
+def synthetic_predictions(frames: int, input_size: int, cluster_size: int, seed: int = 0) -> np.ndarray:
+    """Returns raw network outputs (frames x anchors x 7) of the three YOLOv3 scales for two classes."""
+
+    random_state = np.random.RandomState(seed)
+    anchors = 3 * sum((input_size // stride) ** 2 for stride in (8, 16, 32))
+    pred_bbox = np.empty((frames, anchors, 7), dtype=np.float32)
+    pred_bbox[..., 0:2] = random_state.uniform(0, input_size, (frames, anchors, 2))
+    pred_bbox[..., 2:4] = random_state.uniform(4, input_size / 4, (frames, anchors, 2))
+    pred_bbox[..., 4] = random_state.uniform(0, 0.3, (frames, anchors))
+    pred_bbox[..., 5] = random_state.uniform(0, 1, (frames, anchors))
+    pred_bbox[..., 6] = 1 - pred_bbox[..., 5]
+
+    for frame in pred_bbox:
+        cluster = random_state.choice(anchors, cluster_size, replace=False)
+        center = random_state.uniform(input_size / 4, input_size * 3 / 4, 2)
+        frame[cluster, 0:2] = center + random_state.normal(0, 8, (cluster_size, 2))
+        frame[cluster, 2:4] = random_state.uniform(100, 140, 2) + random_state.normal(0, 8, (cluster_size, 2))
+        frame[cluster, 4] = random_state.uniform(0.8, 1, cluster_size)
+        frame[cluster, 5 + random_state.randint(2)] = random_state.uniform(0.9, 1, cluster_size)
+    return pred_bbox
+
+
+def timed(function: Callable, *args) -> Tuple[Any, float]:
+    """Runs the function with args and returns its result and its duration in seconds."""
+
+    start_time = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=256, help='Amount of synthetic frames.')
+    parser.add_argument('--input_size', type=int, default=544, help='Input size of the model.')
+    parser.add_argument('--threshold', type=float, nargs='+', default=[0.85, 0.3],
+                        help='Score thresholds of the boxes, one per regime.')
+    parser.add_argument('--cluster', type=int, nargs='+', default=[200, 500],
+                        help='Amounts of confident boxes per frame, one per regime.')
+    args = parser.parse_args()
+    assert len(args.threshold) == len(args.cluster), "--threshold and --cluster need the same amount of values"
+
+    for threshold, cluster in zip(args.threshold, args.cluster):
+        print("threshold {}, cluster {}:".format(threshold, cluster))
+        benchmark_regime(args.frames, args.input_size, threshold, cluster)
+
+
+def benchmark_regime(frames: int, input_size: int, threshold: float, cluster: int):
+    """Compares the implementations on one set of synthetic outputs and prints their durations."""
+
+    pred_bbox = synthetic_predictions(frames, input_size, cluster)
+    org_img_shapes = [(2160, 3840)] * frames
+    print("{} frames with {} anchors each".format(*pred_bbox.shape[:2]))
+
+    boxes_loop, duration_loop = timed(predict_loop, pred_bbox, org_img_shapes, input_size, threshold)
+    boxes, duration = timed(predict_vectorized, pred_bbox, org_img_shapes, input_size, threshold)
+    assert all(np.array_equal(np.reshape(a, (-1, 6)), np.reshape(b, (-1, 6))) for a, b in zip(boxes, boxes_loop)), \
+        "postprocess_boxes/nms output differs"
+    print("postprocess_boxes + nms: loop {:.2f}s, vectorized {:.2f}s ({:.1f}x), {:.1f} boxes per frame".format(
+        duration_loop, duration, duration_loop / duration, np.mean([len(b) for b in boxes])))
+
+    best_loop = [max(b, key=lambda bbox: bbox[4]) if len(b) > 0 else None for b in boxes_loop]
+    (has_slate, classes, scores), duration = timed(utils.top_state_batch, pred_bbox, threshold)
+    assert all(h == (b is not None) and (b is None or (c == b[5] and np.isclose(s, b[4])))
+               for h, c, s, b in zip(has_slate, classes, scores, best_loop)), "top_state_batch output differs"
+    print("state only: loop {:.2f}s, top_state_batch {:.3f}s ({:.1f}x)".format(
+        duration_loop, duration, duration_loop / duration))
+
+
+if __name__ == '__main__':
+    main()
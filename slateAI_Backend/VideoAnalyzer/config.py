@@ -7,3 +7,11 @@ CLASS_INDEX_DICT = {
     'open': 1,
     'closed': 0
 }
+
+# Input sizes of the slate detector per analysis stage (see Yolo3Model.profile):
+# the slate search only needs to find slates, the sync point search has to tell open from closed ones.
+# Their predictions are cached apart (the model_id contains the input size).
+MODEL_PROFILES = {
+    'scan': 320,
+    'refine': 544
+}
@@ -41,7 +41,10 @@ def get_anchors(anchors_path):
     return anchors.reshape(3, 3, 2)
 
 
-def image_preporcess(image, target_size, gt_boxes=None):
+def image_preporcess(image, target_size, gt_boxes=None, out=None):
+
+    if out is not None and gt_boxes is None:
+        return image_preporcess_into(image, target_size, out)
 
     image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB).astype(np.float32)
 
@@ -66,6 +69,32 @@ def image_preporcess(image, target_size, gt_boxes=None):
         return image_paded, gt_boxes
 
 
+def image_preporcess_into(image, target_size, out):
+    """Letterboxes a BGR uint8 image into a preallocated float32 RGB buffer (out), scaled to [0, 1].
+
+    Same layout as image_preporcess, but the image is resized before the float conversion and the
+    BGR -> RGB conversion and scaling are written straight into out, so no full frame copies are made.
+    Resizing in uint8 rounds the resized pixels to integers, so values differ from image_preporcess
+    by less than 1/255. Borders and images that already have the target size are identical.
+    """
+
+    ih, iw    = target_size
+    h,  w, _  = image.shape
+
+    scale = min(iw/w, ih/h)
+    nw, nh  = int(scale * w), int(scale * h)
+    image_resized = image if (nw, nh) == (w, h) else cv2.resize(image, (nw, nh))
+
+    dw, dh = (iw - nw) // 2, (ih-nh) // 2
+    out[:dh] = 128. / 255.
+    out[nh+dh:] = 128. / 255.
+    out[dh:nh+dh, :dw] = 128. / 255.
+    out[dh:nh+dh, nw+dw:] = 128. / 255.
+    np.multiply(image_resized[:, :, ::-1], np.float32(1. / 255.), out=out[dh:nh+dh, dw:nw+dw, :])
+
+    return out
+
+
 def draw_bbox(image, bboxes, classes=read_class_names(cfg.YOLO.CLASSES), show_label=True):
     """
     bboxes: [x_min, y_min, x_max, y_max, probability, cls_id] format coordinates.
@@ -139,9 +168,45 @@ def nms(bboxes, iou_threshold, sigma=0.3, method='nms'):
     """
     :param bboxes: (xmin, ymin, xmax, ymax, score, class)
 
+    Greedy per-class nms on the boxes of each class, sorted by descending score. Each kept box is only compared
+    to the boxes left after the previous ones, so a low score threshold (many boxes) does not build an IoU matrix.
+    Same result as the former loop, which recomputed the IoU and rebuilt the array once per kept box.
+
     Note: soft-nms, https://arxiv.org/pdf/1704.04503.pdf
           https://github.com/bharatsingh430/soft-nms
     """
+    assert method in ['nms', 'soft-nms']
+
+    if method == 'soft-nms':
+        return soft_nms(bboxes, sigma)
+
+    bboxes = np.asarray(bboxes)
+    best_bboxes = []
+
+    for cls in np.unique(bboxes[:, 5]):
+        cls_bboxes = bboxes[bboxes[:, 5] == cls]
+        cls_bboxes = cls_bboxes[np.argsort(-cls_bboxes[:, 4], kind='stable')]
+        cls_bboxes = cls_bboxes[cls_bboxes[:, 4] > 0.]
+
+        # indexes of the boxes not suppressed yet, the first one has the highest score
+        order = np.arange(len(cls_bboxes))
+        while len(order) > 0:
+            best_bbox = cls_bboxes[order[0]]
+            best_bboxes.append(best_bbox)
+            order = order[1:]
+            iou = bboxes_iou(best_bbox[np.newaxis, :4], cls_bboxes[order, :4])
+            order = order[iou <= iou_threshold]
+
+    return best_bboxes
+
+
+def soft_nms(bboxes, sigma=0.3):
+    """
+    :param bboxes: (xmin, ymin, xmax, ymax, score, class)
+
+    soft-nms decays the scores of overlapping boxes instead of dropping them, so the kept boxes have to be
+    picked one after the other.
+    """
     classes_in_img = list(set(bboxes[:, 5]))
     best_bboxes = []
 
@@ -155,16 +220,7 @@ def nms(bboxes, iou_threshold, sigma=0.3, method='nms'):
             best_bboxes.append(best_bbox)
             cls_bboxes = np.concatenate([cls_bboxes[: max_ind], cls_bboxes[max_ind + 1:]])
             iou = bboxes_iou(best_bbox[np.newaxis, :4], cls_bboxes[:, :4])
-            weight = np.ones((len(iou),), dtype=np.float32)
-
-            assert method in ['nms', 'soft-nms']
-
-            if method == 'nms':
-                iou_mask = iou > iou_threshold
-                weight[iou_mask] = 0.0
-
-            if method == 'soft-nms':
-                weight = np.exp(-(1.0 * iou ** 2 / sigma))
+            weight = np.exp(-(1.0 * iou ** 2 / sigma))
 
             cls_bboxes[:, 4] = cls_bboxes[:, 4] * weight
             score_mask = cls_bboxes[:, 4] > 0.
@@ -174,18 +230,73 @@ def nms(bboxes, iou_threshold, sigma=0.3, method='nms'):
 
 
 def postprocess_boxes(pred_bbox, org_img_shape, input_size, score_threshold):
+    """
+    :param pred_bbox: (n, 5 + num_classes) raw predictions (x, y, w, h, conf, class probabilities...)
+    :return: (k, 6) boxes (xmin_org, ymin_org, xmax_org, ymax_org, score, class) above score_threshold
 
-    valid_scale=[0, np.inf]
-    pred_bbox = np.array(pred_bbox)
-
-    pred_xywh = pred_bbox[:, 0:4]
-    pred_conf = pred_bbox[:, 4]
+    The scores are computed first, so the coordinate transforms only run on the few boxes above the threshold
+    instead of all anchors (~19k at 544 input).
+    """
+    pred_bbox = np.asarray(pred_bbox)
     pred_prob = pred_bbox[:, 5:]
 
-    # # (1) (x, y, w, h) --> (xmin, ymin, xmax, ymax)
+    # # (1) score of the likeliest class of each box, discard boxes with low scores
+    classes = np.argmax(pred_prob, axis=-1)
+    scores = pred_bbox[:, 4] * np.take_along_axis(pred_prob, classes[:, np.newaxis], axis=-1)[:, 0]
+    score_mask = scores > score_threshold
+
+    return transform_boxes(pred_bbox[score_mask, 0:4], scores[score_mask], classes[score_mask],
+                           org_img_shape, input_size)
+
+
+def postprocess_boxes_batch(pred_bbox, org_img_shapes, input_size, score_threshold):
+    """
+    :param pred_bbox: (batch, n, 5 + num_classes) raw predictions of a batch of images
+    :param org_img_shapes: (org_h, org_w) of each image
+    :return: a list with the (k, 6) boxes of each image, see postprocess_boxes
+
+    The scores of the whole batch are computed in one go.
+    """
+    pred_bbox = np.asarray(pred_bbox)
+    pred_prob = pred_bbox[..., 5:]
+
+    classes = np.argmax(pred_prob, axis=-1)
+    scores = pred_bbox[..., 4] * np.take_along_axis(pred_prob, classes[..., np.newaxis], axis=-1)[..., 0]
+    score_mask = scores > score_threshold
+
+    return [transform_boxes(pred_bbox[i, score_mask[i], 0:4], scores[i, score_mask[i]], classes[i, score_mask[i]],
+                            org_img_shapes[i], input_size)
+            for i in range(len(pred_bbox))]
+
+
+def top_state_batch(pred_bbox, score_threshold):
+    """
+    :param pred_bbox: (batch, n, 5 + num_classes) raw predictions of a batch of images
+    :return: has_slate (batch,), classes (batch,), scores (batch,) of the highest scoring anchor of each image
+
+    No box geometry is computed, has_slate only tells whether the best score is above the threshold.
+    """
+    pred_bbox = np.asarray(pred_bbox)
+    pred_prob = pred_bbox[..., 5:]
+
+    class_scores = pred_bbox[..., 4:5] * pred_prob
+    best = np.argmax(class_scores.reshape(len(pred_bbox), -1), axis=-1)
+    anchors, classes = np.unravel_index(best, pred_prob.shape[1:])
+    scores = class_scores[np.arange(len(pred_bbox)), anchors, classes]
+
+    return scores > score_threshold, classes, scores
+
+
+def transform_boxes(pred_xywh, scores, classes, org_img_shape, input_size):
+    """
+    :return: (k, 6) boxes (xmin_org, ymin_org, xmax_org, ymax_org, score, class) without the invalid ones
+    """
+    valid_scale=[0, np.inf]
+
+    # # (2) (x, y, w, h) --> (xmin, ymin, xmax, ymax)
     pred_coor = np.concatenate([pred_xywh[:, :2] - pred_xywh[:, 2:] * 0.5,
                                 pred_xywh[:, :2] + pred_xywh[:, 2:] * 0.5], axis=-1)
-    # # (2) (xmin, ymin, xmax, ymax) -> (xmin_org, ymin_org, xmax_org, ymax_org)
+    # # (3) (xmin, ymin, xmax, ymax) -> (xmin_org, ymin_org, xmax_org, ymax_org)
     org_h, org_w = org_img_shape
     resize_ratio = min(input_size / org_w, input_size / org_h)
 
@@ -195,24 +306,17 @@ def postprocess_boxes(pred_bbox, org_img_shape, input_size, score_threshold):
     pred_coor[:, 0::2] = 1.0 * (pred_coor[:, 0::2] - dw) / resize_ratio
     pred_coor[:, 1::2] = 1.0 * (pred_coor[:, 1::2] - dh) / resize_ratio
 
-    # # (3) clip some boxes those are out of range
+    # # (4) clip some boxes those are out of range
     pred_coor = np.concatenate([np.maximum(pred_coor[:, :2], [0, 0]),
                                 np.minimum(pred_coor[:, 2:], [org_w - 1, org_h - 1])], axis=-1)
     invalid_mask = np.logical_or((pred_coor[:, 0] > pred_coor[:, 2]), (pred_coor[:, 1] > pred_coor[:, 3]))
     pred_coor[invalid_mask] = 0
 
-    # # (4) discard some invalid boxes
+    # # (5) discard some invalid boxes
     bboxes_scale = np.sqrt(np.multiply.reduce(pred_coor[:, 2:4] - pred_coor[:, 0:2], axis=-1))
-    scale_mask = np.logical_and((valid_scale[0] < bboxes_scale), (bboxes_scale < valid_scale[1]))
-
-    # # (5) discard some boxes with low scores
-    classes = np.argmax(pred_prob, axis=-1)
-    scores = pred_conf * pred_prob[np.arange(len(pred_coor)), classes]
-    score_mask = scores > score_threshold
-    mask = np.logical_and(scale_mask, score_mask)
-    coors, scores, classes = pred_coor[mask], scores[mask], classes[mask]
+    mask = np.logical_and((valid_scale[0] < bboxes_scale), (bboxes_scale < valid_scale[1]))
 
-    return np.concatenate([coors, scores[:, np.newaxis], classes[:, np.newaxis]], axis=-1)
+    return np.concatenate([pred_coor[mask], scores[mask, np.newaxis], classes[mask, np.newaxis]], axis=-1)
 
 
 
@@ -0,0 +1,129 @@
+"""Evaluates the SlateClassifier pre-filter of the slate search against the detector on real video files.
+
+Usage (from the slateAI_Backend directory):
+    python -m VideoAnalyzer.evaluate_classifier --model yolov3_slates.pb --classifier slate_classifier.pb \\
+        /path/to/take_1.mov /path/to/take_2.mp4
+
+Every sampled frame (one per --seconds, like the slate search) is infered by the detector at the scan input size
+and by the classifier. The detector decisions are the reference, for each classifier threshold the script reports:
+    frame recall loss: the share of the detector's slate frames the classifier rejects.
+    group recall loss: the share of slate groups (consecutive slate frames) the classifier rejects completely.
+        A group with a single passed frame is still found by the search, so this is the loss that matters.
+    speedup: the detector on all frames compared to the classifier on all frames plus the detector on the passed
+        ones (the detector time per frame is measured on all frames).
+"""
+
+import argparse
+import time
+import cv2
+import numpy as np
+from VideoAnalyzer.config import MODEL_PROFILES
+from VideoAnalyzer.FrameSource import FrameSource
+from VideoAnalyzer.SlateClassifier import SlateClassifier
+from VideoAnalyzer.Yolo3Model import Yolo3Model
+from typing import List, Tuple
+
+
+def sample_video(video_path: str, seconds: float, model: Yolo3Model, classifier: SlateClassifier,
+                 batch_size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, float, float]:
+    """Infers every sampled frame of a video file with the detector and the classifier.
+
+    Args:
+        video_path: Path of the video file.
+        seconds: The time between two sampled frames.
+        model: The detector.
+        classifier: The classifier.
+        batch_size: Frames per session call.
+
+    Returns:
+        The group index of each sampled frame (-1 without slate), the slate probabilities of the classifier,
+        the sampled frame numbers and the inference durations of the detector and the classifier in seconds.
+    """
+
+    frame_source = FrameSource(video_path, max_bytes=0)
+    stride = max(1, int(round(frame_source.get(cv2.CAP_PROP_FPS) * seconds)))
+    frame_source.max_grab_gap = stride
+    frame_numbers = list(range(0, int(frame_source.get(cv2.CAP_PROP_FRAME_COUNT)), stride))
+
+    has_slate, probabilities, sampled_frames = list(), list(), list()
+    model_duration, classifier_duration = 0., 0.
+    for start in range(0, len(frame_numbers), batch_size):
+        images = frame_source.read_frames(frame_numbers[start:start + batch_size])
+        frames = [frame_number for frame_number, image in images.items() if image is not None]
+        batch = [images[frame_number] for frame_number in frames]
+
+        start_time = time.perf_counter()
+        states = model.predict_state_batch(batch)
+        model_duration += time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        probabilities += list(classifier.predict_batch(batch))
+        classifier_duration += time.perf_counter() - start_time
+
+        has_slate += [state[0] for state in states]
+        sampled_frames += frames
+    frame_source.release()
+
+    return group_indexes(has_slate), np.array(probabilities), np.array(sampled_frames), \
+        model_duration, classifier_duration
+
+
+def group_indexes(has_slate: List[bool]) -> np.ndarray:
+    """Numbers the runs of consecutive slate frames, frames without slate get -1."""
+
+    groups = np.full(len(has_slate), -1)
+    group = -1
+    for i, slate in enumerate(has_slate):
+        if slate:
+            if i == 0 or not has_slate[i - 1]:
+                group += 1
+            groups[i] = group
+    return groups
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('videos', nargs='+', help='Video files to evaluate on.')
+    parser.add_argument('--model', default='yolov3_slates.pb', help='Frozen detector graph.')
+    parser.add_argument('--classifier', default='slate_classifier.pb', help='Frozen classifier graph.')
+    parser.add_argument('--input_size', type=int, default=MODEL_PROFILES['scan'], help='Input size of the detector.')
+    parser.add_argument('--seconds', type=float, default=1.0, help='Time between two sampled frames.')
+    parser.add_argument('--batch_size', type=int, default=16, help='Frames per session call.')
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.02, 0.05, 0.1, 0.2, 0.5],
+                        help='Classifier thresholds to evaluate.')
+    args = parser.parse_args()
+
+    model = Yolo3Model(args.model, input_size=args.input_size)
+    classifier = SlateClassifier(args.classifier)
+
+    groups, probabilities = list(), list()
+    model_duration, classifier_duration = 0., 0.
+    for video_path in args.videos:
+        video_groups, video_probabilities, frames, video_model_duration, video_classifier_duration = sample_video(
+            video_path, args.seconds, model, classifier, args.batch_size)
+        print("{}: {} sampled frames, {} with slate in {} groups".format(
+            video_path, len(frames), np.sum(video_groups >= 0), len(np.unique(video_groups[video_groups >= 0]))))
+        # group numbers stay unique across files
+        offset = max([group.max() for group in groups] + [-1]) + 1
+        groups.append(np.where(video_groups >= 0, video_groups + offset, -1))
+        probabilities.append(video_probabilities)
+        model_duration += video_model_duration
+        classifier_duration += video_classifier_duration
+
+    groups, probabilities = np.concatenate(groups), np.concatenate(probabilities)
+    slate_groups = np.unique(groups[groups >= 0])
+    model_frame_duration = model_duration / max(1, len(groups))
+    print("{} sampled frames, detector {:.1f}ms, classifier {:.1f}ms per frame".format(
+        len(groups), 1000 * model_frame_duration, 1000 * classifier_duration / max(1, len(groups))))
+
+    for threshold in args.thresholds:
+        passed = probabilities >= threshold
+        frame_recall_loss = 1 - np.sum(passed & (groups >= 0)) / max(1, np.sum(groups >= 0))
+        group_recall_loss = 1 - len(np.unique(groups[passed & (groups >= 0)])) / max(1, len(slate_groups))
+        speedup = model_duration / (classifier_duration + model_frame_duration * np.sum(passed))
+        print("threshold {:.2f}: {:.1%} passed, frame recall loss {:.2%}, group recall loss {:.2%}, "
+              "speedup {:.1f}x".format(threshold, np.mean(passed), frame_recall_loss, group_recall_loss, speedup))
+
+
+if __name__ == '__main__':
+    main()
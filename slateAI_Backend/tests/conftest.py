@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the backend imports its packages relative to the slateAI_Backend directory (e.g. VideoAnalyzer.config)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,43 @@
+import cv2
+import numpy as np
+import pytest
+
+from VideoAnalyzer.FrameSource import FrameSource
+
+FRAME_COUNT = 60
+
+
+@pytest.fixture(scope="module")
+def video_path(tmp_path_factory):
+    """A 60 frame MJPEG file, every frame is filled with 4 x its frame number."""
+
+    path = str(tmp_path_factory.mktemp("video") / "frames.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 25, (64, 48))
+    if not writer.isOpened():
+        pytest.skip("OpenCV cannot write MJPEG files")
+    for frame_number in range(FRAME_COUNT):
+        writer.write(np.full((48, 64, 3), 4 * frame_number, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def frame_number_of(image):
+    return int(round(np.mean(image) / 4))
+
+
+@pytest.mark.parametrize("max_grab_gap", [0, 16])
+@pytest.mark.parametrize("frame_numbers", [range(-4, 5), range(FRAME_COUNT - 5, FRAME_COUNT + 4)])
+def test_read_frames_near_the_borders(video_path, frame_numbers, max_grab_gap):
+    frame_source = FrameSource(video_path, max_grab_gap=max_grab_gap)
+
+    # read twice, the second read is served from the buffer
+    for _ in range(2):
+        images = frame_source.read_frames(list(frame_numbers))
+
+        assert sorted(images.keys()) == list(frame_numbers)
+        for frame_number, image in images.items():
+            if 0 <= frame_number < FRAME_COUNT:
+                assert frame_number_of(image) == frame_number
+            else:
+                assert image is None
+    frame_source.release()
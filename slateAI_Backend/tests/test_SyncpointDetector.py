@@ -0,0 +1,83 @@
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from VideoAnalyzer.config import CLASS_INDEX_DICT
+from VideoAnalyzer.SyncpointDetector import SyncpointDetector
+
+
+class ConstantModel:
+    """Predicts the same slate state for every frame."""
+
+    model_id = "constant"
+
+    def __init__(self, class_index, confidence=0.9):
+        self.state = (True, class_index, confidence)
+
+    def predict_state_batch(self, images):
+        assert all(image is not None for image in images)
+        return [self.state for _ in images]
+
+
+class BlankFrameSource:
+    """Returns black frames, or None outside of the file like the FrameSource."""
+
+    def __init__(self, frame_count):
+        self.frame_count = frame_count
+
+    def get(self, prop):
+        assert prop == cv2.CAP_PROP_FRAME_COUNT
+        return self.frame_count
+
+    def read_frames(self, frame_numbers):
+        return {frame_number: np.zeros((4, 4, 3), dtype=np.uint8) if 0 <= frame_number < self.frame_count else None
+                for frame_number in frame_numbers}
+
+
+@pytest.mark.parametrize("class_name", ["open", "closed"])
+@pytest.mark.parametrize("max_steps", [3, 15])
+def test_group_without_transition_returns_frame_in_group(class_name, max_steps):
+    detector = SyncpointDetector(confidence_margin=7, confidence_threshold=0.85,
+                                 model=ConstantModel(CLASS_INDEX_DICT[class_name]),
+                                 frame_source=BlankFrameSource(1000), sample_rate=30)
+
+    syncpoints = detector.find_all_syncpoints_binary([[300, 330, 360]], max_steps=max_steps, max_retries=2)
+
+    assert len(syncpoints) == 1
+    assert isinstance(syncpoints[0], int)
+    assert 270 <= syncpoints[0] <= 390
+
+
+def test_likeliest_syncpoint_prefers_confident_bracket():
+    open_idx, closed_idx = CLASS_INDEX_DICT['open'], CLASS_INDEX_DICT['closed']
+    observations = {0: (open_idx, 0.), 10: (closed_idx, 0.2), 20: (open_idx, 0.9), 21: (closed_idx, 0.9),
+                    40: (closed_idx, 0.)}
+
+    assert SyncpointDetector.likeliest_syncpoint(observations, 0, 40) == 20
+    assert SyncpointDetector.likeliest_syncpoint({0: (open_idx, 0.), 5: (open_idx, 0.9)}, 0, 5) == 5
+    assert SyncpointDetector.likeliest_syncpoint({0: (closed_idx, 0.), 5: (closed_idx, 0.9)}, 0, 5) == 0
+    assert SyncpointDetector.likeliest_syncpoint({0: (open_idx, 0.), 12: (open_idx, 0.9)}, 0, 10) == 10
+
+
+@pytest.mark.parametrize("frame_number, expected_frames", [(2, range(0, 10)), (997, range(990, 1000))])
+def test_pad_final_prediction_stays_within_file(frame_number, expected_frames):
+    detector = SyncpointDetector(confidence_margin=7, confidence_threshold=0.85,
+                                 model=ConstantModel(CLASS_INDEX_DICT['open']),
+                                 frame_source=BlankFrameSource(1000), sample_rate=30)
+
+    padded = detector.pad_final_prediction(frame_number)
+
+    assert list(padded[:, 0]) == list(expected_frames)
+
+
+def test_predict_frames_leaves_out_unreadable_frames():
+    detector = SyncpointDetector(confidence_margin=7, confidence_threshold=0.85,
+                                 model=ConstantModel(CLASS_INDEX_DICT['open']),
+                                 frame_source=BlankFrameSource(1000), sample_rate=30)
+
+    states = detector.predict_frames([998, 999, 1000, 1001])
+
+    assert states[:2] == [(True, CLASS_INDEX_DICT['open'], 0.9)] * 2
+    assert states[2:] == [None, None]
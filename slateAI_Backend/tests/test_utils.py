@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("tensorflow")
+
+import VideoAnalyzer.core.utils as utils
+
+
+@pytest.mark.parametrize("shape", [(1080, 1920, 3), (480, 360, 3), (544, 544, 3)])
+def test_image_preporcess_into_matches_image_preporcess(shape):
+    image = np.random.RandomState(0).randint(0, 256, shape, dtype=np.uint8)
+    out = np.empty((544, 544, 3), dtype=np.float32)
+
+    expected = utils.image_preporcess(np.copy(image), [544, 544])
+    result = utils.image_preporcess(image, [544, 544], out=out)
+
+    assert result is out
+    assert result.shape == expected.shape
+    # the resize in uint8 rounds the resized pixels
+    np.testing.assert_allclose(result, expected, rtol=0, atol=1. / 255.)
+    if shape[:2] == (544, 544):
+        np.testing.assert_allclose(result, expected, rtol=0, atol=1e-6)
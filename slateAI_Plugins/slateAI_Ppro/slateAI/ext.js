@@ -234,29 +234,55 @@ function receiveMessage(message) {
             document.getElementById("plaidmldropdownbutton").innerHTML = chosenDevice;
 
         }
+        //check if message is an intermediate result: slate groups found in a video
+        else if (message.startsWith('{"slateGroups"')) {
+            var slateGroups = JSON.parse(message)['slateGroups'];
+            console.log("slate groups found:", slateGroups);
+        }
+        //check if message is an intermediate result: one sync point of a video
+        else if (message.startsWith('{"syncpoint"')) {
+            var syncpointDict = JSON.parse(message)['syncpoint'];
+            var syncpointPath = Object.keys(syncpointDict)[0];
+            addClipMarkers(syncpointPath, [syncpointDict[syncpointPath]]);
+        }
         else {
-            //message is an analyzed result
+            //message is an analyzed result, the final message for a file
             //convert String to dict
             var currentPathClapTimesDict = JSON.parse(message);
             //get Path and Time
             var currentPath = Object.keys(currentPathClapTimesDict)[0];
             var currentTimes = currentPathClapTimesDict[currentPath];
             console.log("currentTimes:", currentTimes);
-            //add marker(s)
-            var csInterface = new CSInterface();
-            // replace "\" with "/" so they dont get deleted when used as parameter
-            currentPath = currentPath.split("\\").join("/");
-            for (var i = 0; i < currentTimes.length; i++) {
-                var addClipcommand = '$._PPP_.addClipMarker("' + currentPath + '",' + currentTimes[i] + ', app.project.rootItem, "' + process.platform + '")';
-                console.log(addClipcommand);
-                csInterface.evalScript(addClipcommand);
-            }
+            //add marker(s) that have not been added by intermediate results
+            addClipMarkers(currentPath, currentTimes);
+            delete placedMarkers[currentPath];
         }
     } else {
         console.log("WARNING: received empty message");
     }
 }
 
+//sync points already marked per path: {path: [time, ...]}
+var placedMarkers = {};
+
+function addClipMarkers(path, times) {
+    if (!(path in placedMarkers)) {
+        placedMarkers[path] = [];
+    }
+    var csInterface = new CSInterface();
+    // replace "\" with "/" so they dont get deleted when used as parameter
+    var markerPath = path.split("\\").join("/");
+    for (var i = 0; i < times.length; i++) {
+        if (placedMarkers[path].includes(times[i])) {
+            continue;
+        }
+        placedMarkers[path].push(times[i]);
+        var addClipcommand = '$._PPP_.addClipMarker("' + markerPath + '",' + times[i] + ', app.project.rootItem, "' + process.platform + '")';
+        console.log(addClipcommand);
+        csInterface.evalScript(addClipcommand);
+    }
+}
+
 function updateStatus(statusinfo) {
     var itemsRemaining = statusinfo['Statusinfo']['itemsRemaining'];
     var currentItem = statusinfo['Statusinfo']['current'];
@@ -0,0 +1,16 @@
+import tensorflow as tf
+
+
+def build_classifier(input_size, alpha, weights=None):
+    # MobileNetV2 with a single sigmoid output: is a slate visible in the (letterboxed, see image_preporcess) frame.
+    # The node names "input_data" and "slate_prob/Sigmoid" are the ones the backend reads from the frozen graph.
+    input_data = tf.keras.layers.Input(shape=(input_size, input_size, 3), name='input_data')
+    # image_preporcess scales to [0, 1], MobileNetV2 expects [-1, 1]
+    scaled = tf.keras.layers.Lambda(lambda x: x * 2. - 1., name='scale')(input_data)
+
+    backbone = tf.keras.applications.MobileNetV2(input_shape=(input_size, input_size, 3), alpha=alpha,
+                                                 include_top=False, weights=weights, pooling='avg')
+    features = tf.keras.layers.Dropout(0.2)(backbone(scaled))
+    slate_prob = tf.keras.layers.Dense(1, activation='sigmoid', name='slate_prob')(features)
+
+    return tf.keras.models.Model(inputs=input_data, outputs=slate_prob), backbone
@@ -0,0 +1,107 @@
+import os
+import cv2
+import random
+import numpy as np
+import tensorflow as tf
+import core.utils as utils
+from core.config import cfg
+
+
+class ClassifierDataset(tf.keras.utils.Sequence):
+    """slate / no slate batches from the annotation files of the detector"""
+    def __init__(self, dataset_type):
+
+        self.annot_path    = cfg.TRAIN.ANNOT_PATH if dataset_type == 'train' else cfg.TEST.ANNOT_PATH
+        self.input_size    = cfg.CLASSIFIER.INPUT_SIZE
+        self.batch_size    = cfg.CLASSIFIER.BATCH_SIZE
+        self.data_aug      = cfg.CLASSIFIER.DATA_AUG if dataset_type == 'train' else False
+        # share of the annotated images used as negative sample (the part of the image beside the slates)
+        self.negative_crop = cfg.CLASSIFIER.NEGATIVE_CROP
+
+        self.annotations = self.load_annotations()
+        self.num_samples = len(self.annotations)
+        self.num_batchs = int(np.ceil(self.num_samples / self.batch_size))
+
+    def load_annotations(self):
+        # unlike the detector Dataset, lines without boxes are kept as negative samples
+        with open(self.annot_path, 'r') as f:
+            annotations = [line.strip() for line in f.readlines() if len(line.strip()) != 0]
+        np.random.shuffle(annotations)
+        return annotations
+
+    def __len__(self):
+        return self.num_batchs
+
+    def __getitem__(self, index):
+        annotations = self.annotations[index * self.batch_size:(index + 1) * self.batch_size]
+
+        batch_image = np.zeros((len(annotations), self.input_size, self.input_size, 3), dtype=np.float32)
+        batch_label = np.zeros((len(annotations), 1), dtype=np.float32)
+
+        for num, annotation in enumerate(annotations):
+            image, label = self.parse_annotation(annotation)
+            batch_image[num] = utils.image_preporcess(np.copy(image), [self.input_size, self.input_size])
+            batch_label[num] = label
+
+        return batch_image, batch_label
+
+    def on_epoch_end(self):
+        np.random.shuffle(self.annotations)
+
+    def parse_annotation(self, annotation):
+
+        line = annotation.split()
+        image_path = line[0]
+        if not os.path.exists(image_path):
+            raise KeyError("%s does not exist ... " %image_path)
+        image = np.array(cv2.imread(image_path))
+        bboxes = np.array([list(map(lambda x: int(float(x)), box.split(','))) for box in line[1:]])
+
+        if len(bboxes) == 0:
+            return self.random_horizontal_flip(image), 0.
+
+        if random.random() < self.negative_crop:
+            negative = self.crop_beside_boxes(image, bboxes)
+            if negative is not None:
+                return self.random_horizontal_flip(negative), 0.
+
+        if self.data_aug:
+            image = self.random_crop(image, bboxes)
+        return self.random_horizontal_flip(image), 1.
+
+    def random_horizontal_flip(self, image):
+
+        if self.data_aug and random.random() < 0.5:
+            image = image[:, ::-1, :]
+
+        return image
+
+    def random_crop(self, image, bboxes):
+        # keeps all boxes inside the crop
+
+        if random.random() < 0.5:
+            h, w, _ = image.shape
+            max_bbox = np.concatenate([np.min(bboxes[:, 0:2], axis=0), np.max(bboxes[:, 2:4], axis=0)], axis=-1)
+
+            crop_xmin = max(0, int(max_bbox[0] - random.uniform(0, max_bbox[0])))
+            crop_ymin = max(0, int(max_bbox[1] - random.uniform(0, max_bbox[1])))
+            crop_xmax = min(w, int(max_bbox[2] + random.uniform(0, w - max_bbox[2])))
+            crop_ymax = min(h, int(max_bbox[3] + random.uniform(0, h - max_bbox[3])))
+
+            image = image[crop_ymin : crop_ymax, crop_xmin : crop_xmax]
+
+        return image
+
+    def crop_beside_boxes(self, image, bboxes):
+        # the largest strip left, right, above or below all boxes, None if every strip is too thin
+
+        h, w, _ = image.shape
+        xmin, ymin = np.min(bboxes[:, 0:2], axis=0)
+        xmax, ymax = np.max(bboxes[:, 2:4], axis=0)
+
+        strips = [(0, 0, xmin, h), (xmax, 0, w, h), (0, 0, w, ymin), (0, ymax, w, h)]
+        x1, y1, x2, y2 = max(strips, key=lambda strip: (strip[2] - strip[0]) * (strip[3] - strip[1]))
+        if x2 - x1 < w // 4 or y2 - y1 < h // 4:
+            return None
+
+        return image[int(y1) : int(y2), int(x1) : int(x2)]
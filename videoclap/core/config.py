@@ -66,6 +66,18 @@ __C.TEST.IOU_THRESHOLD          = 0.45
 
 
 
-
-
-
+# Slate classifier options (the pre-filter of the slate search in the backend)
+__C.CLASSIFIER                      = edict()
+
+__C.CLASSIFIER.INPUT_SIZE           = 160
+__C.CLASSIFIER.ALPHA                = 0.35
+__C.CLASSIFIER.BATCH_SIZE           = 32
+__C.CLASSIFIER.DATA_AUG             = True
+__C.CLASSIFIER.NEGATIVE_CROP        = 0.5
+__C.CLASSIFIER.LEARN_RATE_INIT      = 1e-3
+__C.CLASSIFIER.LEARN_RATE_END       = 1e-5
+__C.CLASSIFIER.FIRST_STAGE_EPOCHS   = 5
+__C.CLASSIFIER.SECOND_STAGE_EPOCHS  = 10
+__C.CLASSIFIER.INITIAL_WEIGHT       = "imagenet"
+__C.CLASSIFIER.WEIGHT_FILE          = "./checkpoint/slate_classifier.h5"
+__C.CLASSIFIER.PB_FILE              = "./slate_classifier.pb"
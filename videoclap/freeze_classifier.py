@@ -0,0 +1,22 @@
+import tensorflow as tf
+from core.config import cfg
+from core.classifier import build_classifier
+
+# Freezes the weights of train_classifier.py into slate_classifier.pb for the backend (next to yolov3_slates.pb).
+
+pb_file = cfg.CLASSIFIER.PB_FILE
+weight_file = cfg.CLASSIFIER.WEIGHT_FILE
+output_node_names = ["input_data", "slate_prob/Sigmoid"]
+
+tf.keras.backend.set_learning_phase(0)
+model, _ = build_classifier(cfg.CLASSIFIER.INPUT_SIZE, cfg.CLASSIFIER.ALPHA)
+model.load_weights(weight_file)
+print(model.input, model.output)
+
+sess = tf.keras.backend.get_session()
+converted_graph_def = tf.graph_util.convert_variables_to_constants(sess,
+                            input_graph_def  = sess.graph.as_graph_def(),
+                            output_node_names = output_node_names)
+
+with tf.gfile.GFile(pb_file, "wb") as f:
+    f.write(converted_graph_def.SerializeToString())
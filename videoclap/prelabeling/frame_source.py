@@ -0,0 +1,67 @@
+from collections import OrderedDict
+
+import cv2
+
+
+class FrameSource:
+    # Reads frames by number, decoding forward instead of seeking for frames shortly after the current position.
+    # The most recently read frames are kept in a ring buffer of at most max_bytes.
+
+    def __init__(self, video_path, max_bytes=256 * 1024 * 1024, max_grab_gap=16):
+        self.cap = cv2.VideoCapture(video_path)
+        self.max_bytes = max_bytes
+        self.max_grab_gap = max_grab_gap
+        self.buffer = OrderedDict()
+        self.buffer_bytes = 0
+        self.position = None
+
+        self.decodes = 0
+        self.seeks = 0
+        self.hits = 0
+
+    def get(self, prop_id):
+        return self.cap.get(prop_id)
+
+    def read(self, frame_number):
+        if frame_number in self.buffer:
+            self.buffer.move_to_end(frame_number)
+            self.hits += 1
+            return self.buffer[frame_number]
+
+        image = self.decode(frame_number)
+        self.store(frame_number, image)
+        return image
+
+    def decode(self, frame_number):
+        if self.position is None or not 0 <= frame_number - self.position <= self.max_grab_gap:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+            self.position = frame_number
+            self.seeks += 1
+
+        while self.position < frame_number and self.cap.grab():
+            self.position += 1
+            self.decodes += 1
+
+        _, image = self.cap.read()
+        self.position = frame_number + 1 if image is not None else None
+        self.decodes += 1
+        return image
+
+    def store(self, frame_number, image):
+        if image is None or image.nbytes > self.max_bytes:
+            return
+
+        self.buffer[frame_number] = image
+        self.buffer_bytes += image.nbytes
+        while self.buffer_bytes > self.max_bytes:
+            _, dropped = self.buffer.popitem(last=False)
+            self.buffer_bytes -= dropped.nbytes
+
+    def stats(self):
+        return {"decodes": self.decodes, "seeks": self.seeks, "hits": self.hits, "buffered": len(self.buffer)}
+
+    def release(self):
+        self.cap.release()
+        self.buffer.clear()
+        self.buffer_bytes = 0
+        self.position = None
@@ -2,17 +2,17 @@ import cv2
 from secrets import token_hex
 
 from prelabeling.annotation_object import AnnotationObject
+from prelabeling.frame_source import FrameSource
 
 
 class Video:
 
     def __init__(self, video_path):
-        self.cap = cv2.VideoCapture(video_path)
-        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.frame_source = FrameSource(video_path)
+        self.frame_count = int(self.frame_source.get(cv2.CAP_PROP_FRAME_COUNT))
         self.key = token_hex(16)
 
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-        _, image = self.cap.read()
+        image = self.frame_source.read(0)
 
         if image is None:
             print("None in image")
@@ -42,12 +42,10 @@ class Video:
         self.annotations.append(annotation)
 
     def get_frame(self, frame_number):
-        self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-        _, image = self.cap.read()
-        return image
+        return self.frame_source.read(frame_number)
 
     def get_total_frames(self):
-        return int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        return int(self.frame_source.get(cv2.CAP_PROP_FRAME_COUNT))
 
     def create_json_string(self):
         objects = self.create_annotation_entries()
@@ -0,0 +1,53 @@
+import os
+import numpy as np
+import tensorflow as tf
+from core.config import cfg
+from core.classifier import build_classifier
+from core.classifier_dataset import ClassifierDataset
+
+# Trains the slate classifier the backend uses to skip frames without slates before running YOLOv3.
+# Same annotation files as train.py. First stage: only the head on top of the imagenet backbone, second stage: all.
+# Freeze the best weights with freeze_classifier.py afterwards.
+
+
+class ClassifierTrain(object):
+    def __init__(self):
+        self.input_size          = cfg.CLASSIFIER.INPUT_SIZE
+        self.learn_rate_init     = cfg.CLASSIFIER.LEARN_RATE_INIT
+        self.learn_rate_end      = cfg.CLASSIFIER.LEARN_RATE_END
+        self.first_stage_epochs  = cfg.CLASSIFIER.FIRST_STAGE_EPOCHS
+        self.second_stage_epochs = cfg.CLASSIFIER.SECOND_STAGE_EPOCHS
+        self.weight_file         = cfg.CLASSIFIER.WEIGHT_FILE
+        self.trainset            = ClassifierDataset('train')
+        self.testset             = ClassifierDataset('test')
+
+        self.model, self.backbone = build_classifier(self.input_size, cfg.CLASSIFIER.ALPHA,
+                                                     cfg.CLASSIFIER.INITIAL_WEIGHT)
+        # one checkpoint callback for both stages, so the second stage only saves weights better than the first
+        self.checkpoint = tf.keras.callbacks.ModelCheckpoint(self.weight_file, save_best_only=True,
+                                                             save_weights_only=True)
+
+    def learn_rate(self, epoch):
+        # cosine decay over both stages, like the detector
+        epochs = self.first_stage_epochs + self.second_stage_epochs
+        return self.learn_rate_end + 0.5 * (self.learn_rate_init - self.learn_rate_end) * \
+            (1 + np.cos(epoch / epochs * np.pi))
+
+    def fit(self, initial_epoch, epochs, backbone_trainable):
+        self.backbone.trainable = backbone_trainable
+        self.model.compile(optimizer=tf.keras.optimizers.Adam(self.learn_rate_init),
+                           loss='binary_crossentropy', metrics=['accuracy'])
+        self.model.fit_generator(self.trainset, validation_data=self.testset,
+                                 initial_epoch=initial_epoch, epochs=epochs,
+                                 callbacks=[tf.keras.callbacks.LearningRateScheduler(self.learn_rate),
+                                            self.checkpoint])
+
+    def train(self):
+        if not os.path.exists(os.path.dirname(self.weight_file)): os.makedirs(os.path.dirname(self.weight_file))
+
+        if self.first_stage_epochs > 0:
+            self.fit(0, self.first_stage_epochs, backbone_trainable=False)
+        self.fit(self.first_stage_epochs, self.first_stage_epochs + self.second_stage_epochs, backbone_trainable=True)
+
+
+if __name__ == '__main__': ClassifierTrain().train()